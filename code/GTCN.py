@@ -1,10 +1,17 @@
 import pytorch_lightning as pl
 from torch_geometric.loader import DataLoader
 from torch_geometric.nn import GCNConv, Sequential, global_add_pool, global_mean_pool, DeepGCNLayer
+from torch_geometric.data import Batch
+from torch_geometric.utils import softmax
 from models.GTCNlayer import GTCNlayer
+from hea2data import atoms_to_data
+from hea2graph import (NODE_FEATURE_BLOCKS, NODE_CONTINUOUS_SCALE, NODE_FEATURE_NAMES, NODE_TOKEN_SCALE,
+                       NODE_TOKEN_OFFSET)
 from torch.nn import Dropout, Linear, ReLU, LayerNorm
 import torch.nn.functional as F
 import torch
+import bisect
+import itertools
 
 
 class GTCN(pl.LightningModule):
@@ -23,43 +30,147 @@ class GTCN(pl.LightningModule):
         self.En = config.E_node
         Ee = config.E_edge
         self.max_node_fea = config.max_fea_val + 1
-        self.emb = torch.nn.Embedding(self.max_node_fea, self.En)
+        # (length, electronegativity_diff, mismatch) scaling
+        self.register_buffer('edge_scale', torch.tensor([4.0, 4.0, 40.0]), persistent=False)
+        self._edge_cache = None
+        # 'embedding': every node feature is an integer token of self.emb
+        # (original; float features are tokenized as in hea2graph.NODE_TOKEN_SCALE); 'species': the one-hot blocks become summed species
+        # embeddings and the continuous block a Linear on fixed-scaled values
+        self.node_encoder = getattr(config, 'node_encoder', 'embedding')
+        if self.node_encoder == 'species':
+            if self.Node_fea != 77:
+                raise ValueError(f"node_encoder='species' needs the 77 hea2graph node features, not {self.Node_fea}")
+            node_dim = getattr(config, 'node_dim', 32)
+            self.onehot_blocks = ['atomic_number', 'period', 'group']
+            self.onehot_emb = torch.nn.ModuleList(
+                [torch.nn.Embedding(NODE_FEATURE_BLOCKS[b].stop - NODE_FEATURE_BLOCKS[b].start, node_dim)
+                 for b in self.onehot_blocks])
+            self.register_buffer('node_scale', torch.tensor(NODE_CONTINUOUS_SCALE, dtype=torch.float), persistent=False)
+            self.node_lin = Linear(len(NODE_CONTINUOUS_SCALE), node_dim)
+            in_dim = node_dim
+        elif self.node_encoder == 'embedding':
+            self.emb = torch.nn.Embedding(self.max_node_fea, self.En)
+            self.register_buffer('token_scale', torch.tensor(NODE_TOKEN_SCALE, dtype=torch.float), persistent=False)
+            in_dim = self.Node_fea*self.En
+        else:
+            raise ValueError(f"node_encoder must be 'embedding' or 'species', not {self.node_encoder!r}")
         heads = config.heads
         h_out = self.hidden // heads
 
+        # 'scatter' (message passing) or 'dense' (fixed-degree neighbour table)
+        mode = getattr(config, 'attention', 'scatter')
+
         act = None if config.act == 'None' else config.act
         act = eval(config.act)
-        self.layer_begin = GTCNlayer(self.Node_fea*self.En, h_out, heads, edge_dim=Ee, act=act, fill_value=1.0, beta=config.beta)
+        self.layer_begin = GTCNlayer(in_dim, h_out, heads, edge_dim=Ee, act=act, fill_value=1.0, beta=config.beta, mode=mode)
         Layers = []
         for i in range(config.layers):
-            Layers.append(DeepGCNLayer(GTCNlayer(h_out*heads, h_out, heads, edge_dim=Ee, act=act, fill_value=1.0, beta=config.beta)))
+            Layers.append(DeepGCNLayer(GTCNlayer(h_out*heads, h_out, heads, edge_dim=Ee, act=act, fill_value=1.0, beta=config.beta, mode=mode)))
         self.layers = torch.nn.ModuleList(Layers)
+        self.conv_stack()
+        # 'node': one output per atom (original behaviour); 'sum', 'mean' or
+        # 'attention': pool over config.batch first, one output per structure
+        self.readout = getattr(config, 'readout', 'node')
+        if self.readout not in ('node', 'sum', 'mean', 'attention'):
+            raise ValueError(f"readout must be 'node', 'sum', 'mean' or 'attention', not {self.readout!r}")
+        if self.readout == 'attention':
+            self.gate = Linear(h_out*heads, 1)
         self.w = torch.nn.Sequential(Linear(h_out*heads,  2048))
         self.out = torch.nn.Sequential(Linear(2048, 1),
                                        Linear(1, 1))      
 
-    def forward(self, x, edge_index, edge_attr, batch_index):
-        edge_attr = edge_attr.float()/4.0
-        #print('EA1:', edge_attr)
-        edge_attr[:, 2]= edge_attr[:, 2]/10
-        #print('EA2:', edge_attr)
-        x = self.emb(x).view(-1, self.Node_fea*self.En)
+    def scale_edges(self, edge_attr):
+        # out of place, so the caller's edge_attr is never modified; in eval the
+        # scaled tensor is reused for the same edge_attr, which lets the layers'
+        # edge-projection caches hit as well
+        # inference-mode tensors have no version counter, so they are not cached
+        use_cache = not self.training and not edge_attr.is_inference()
+        cache = self._edge_cache
+        if use_cache and cache is not None and cache[0] is edge_attr and cache[1] == edge_attr._version:
+            return cache[2]
+        scaled = edge_attr.float() / self.edge_scale
+        self._edge_cache = (edge_attr, edge_attr._version, scaled) if use_cache else None
+        return scaled
+
+    def train(self, mode=True):
+        self._edge_cache = None
+        return super().train(mode)
+
+    def embed_nodes(self, x):
+        # node features (or integer tokens) -> layer_begin input
+        if self.node_encoder == 'species':
+            x = x.float()
+            h = self.node_lin(x[:, NODE_FEATURE_BLOCKS['continuous']] / self.node_scale)
+            for block, emb in zip(self.onehot_blocks, self.onehot_emb):
+                h = h + emb(x[:, NODE_FEATURE_BLOCKS[block]].argmax(dim=1))
+            return h
+        if x.is_floating_point():
+            x = self.tokenize(x)
+        return self.emb(x).view(-1, self.Node_fea*self.En)
+
+    def tokenize(self, x):
+        # hea2data.atoms_to_data features -> integer tokens for self.emb
+        if x.size(1) != self.token_scale.numel():
+            raise ValueError(f"float node features must be the {self.token_scale.numel()} hea2graph columns, "
+                             f"not {x.size(1)}")
+        x = torch.round(x * self.token_scale).long() + NODE_TOKEN_OFFSET
+        outside = ((x < 0) | (x >= self.max_node_fea)).any(dim=0)
+        if outside.any():
+            column = int(outside.nonzero()[0])
+            raise ValueError(f"node feature {NODE_FEATURE_NAMES[column]!r} has tokens outside "
+                             f"0..{self.max_node_fea - 1}; raise config.max_fea_val")
+        return x
+
+    def encode(self, x, edge_index, edge_attr):
+        # node features -> hidden node states after the GTCNlayer stack
+        edge_attr = self.scale_edges(edge_attr)
+        x = self.embed_nodes(x)
         x = self.layer_begin(x, edge_index, edge_attr)
         x = F.relu(x)
         for i, l in enumerate(self.layers):
             x = l(x, edge_index, edge_attr)
             x = F.relu(x)
-        #x = global_mean_pool(x, batch_index)
-        #print('x', x)
+        return x
+
+    def conv_stack(self):
+        # (GTCNlayer, residual) for every step of encode(), for the code that
+        # runs the layers itself (encode_chunked, swapmc.SwapEvaluator and
+        # export.GTCNEngine): a DeepGCNLayer 'res+' block is x + conv(x) only
+        # while it has no norm, act or dropout, which is checked here and when
+        # the model is built
+        for l in self.layers:
+            if l.block != 'res+' or l.norm is not None or l.act is not None or l.dropout > 0:
+                raise ValueError("conv_stack unrolls only DeepGCNLayer 'res+' blocks without norm, act or dropout")
+        return [(self.layer_begin, False)] + [(l.conv, True) for l in self.layers]
+
+    @staticmethod
+    def conv_step(h, out, residual):
+        # the node states after one conv_stack step with conv output out
+        return F.relu(h + out if residual else out)
+
+    def pool(self, x, batch_index):
+        if batch_index is None:
+            batch_index = x.new_zeros(x.size(0), dtype=torch.long)
+        if self.readout == 'sum':
+            return global_add_pool(x, batch_index)
+        elif self.readout == 'mean':
+            return global_mean_pool(x, batch_index)
+        a = softmax(self.gate(x), batch_index)
+        return global_add_pool(x*a, batch_index)
+
+    def readout_head(self, x, batch_index):
+        # hidden node states -> per-node or per-graph outputs
+        if self.readout != 'node':
+            x = self.pool(x, batch_index)
         x = self.w(x)
-        #a = torch.exp(a)
-        #x = global_add_pool(x*a, batch_index)
-        #a = global_add_pool(a, batch_index)
-        #x = x/a
         x1 = self.out(x)
         x2 = torch.clip(x1, self.YMIN, self.YMAX)
         x_out = (x1+x2)/2
-        return x_out.squeeze()
+        return x_out.squeeze(-1)
+
+    def forward(self, x, edge_index, edge_attr, batch_index):
+        x = self.encode(x, edge_index, edge_attr)
+        return self.readout_head(x, batch_index)
     
     def _f(self, batch, batch_index):
         x, edge_index = batch.x, batch.edge_index
@@ -70,13 +181,19 @@ class GTCN(pl.LightningModule):
     
     def _loss(self, batch, batch_index, tag):
         x_out = self._f(batch, batch_index)
-        batch.y3 = torch.tensor(sum(batch.y3, []), device=self.device)
-        loss = F.smooth_l1_loss(x_out, batch.y3, beta=0.1)
+        if self.readout == 'node':
+            # per-node targets, collated by PyG like x (headata.HEADataset)
+            y = batch.y3
+            if isinstance(y, list):
+                y = torch.tensor(list(itertools.chain.from_iterable(y)), device=self.device)
+        else:
+            y = batch.y.view(-1)
+        y = y.float()
+        loss = F.smooth_l1_loss(x_out, y, beta=0.1)
         x_out = torch.clip(x_out, self.YMIN, self.YMAX)
-        mae = F.l1_loss(x_out, batch.y3)
-        self.log(f"{tag}_mae", mae, batch_size = batch.y3.shape[0], prog_bar=True)
-        #print(f"{tag}", batch.y3.shape[0])
-        print(f"{tag}", mae)
+        mae = F.l1_loss(x_out, y)
+        # accumulated on device and reduced once per epoch: no per-step host sync
+        self.log(f"{tag}_mae", mae.detach(), batch_size=y.shape[0], prog_bar=True, on_step=False, on_epoch=True)
         return loss
 
     def training_step(self, batch, batch_index):
@@ -89,6 +206,76 @@ class GTCN(pl.LightningModule):
         x_out = self._f(batch, batch_index)
         return torch.clip(x_out, self.YMIN, self.YMAX)
 
+    @torch.no_grad()
+    def predict_structures(self, structures, batch_size=64, cutoff=3.5, lattice=None):
+        """One prediction per structure for an iterable of ASE Atoms or CIF paths.
+
+        Structures are featurized with hea2data.atoms_to_data and run through
+        the model batch_size at a time, so only one batch is held in memory.
+        With readout='node' the per-atom outputs are averaged per structure.
+        lattice is passed on to atoms_to_data for non-108/128-atom cells.
+        """
+        was_training = self.training
+        self.eval()
+        preds = []
+        structures = iter(structures)
+        while True:
+            chunk = list(itertools.islice(structures, batch_size))
+            if not chunk:
+                break
+            batch = Batch.from_data_list([atoms_to_data(s, cutoff, lattice) for s in chunk]).to(self.device)
+            out = self.predict_step(batch, 0)
+            if self.readout == 'node':
+                out = global_mean_pool(out.view(-1, 1), batch.batch)
+            preds.append(out.view(-1).cpu())
+        self.train(was_training)
+        return torch.cat(preds) if preds else torch.zeros(0)
+
+    def encode_chunked(self, x, edge_index, edge_attr, max_edges=65536):
+        # encode() for one large graph whose edges are sorted by target node
+        # (hea2data.atoms_to_data): every layer runs on blocks of target nodes
+        # with at most max_edges incoming edges, so the per-edge attention
+        # tensors never hold more than max_edges rows
+        edge_attr = self.scale_edges(edge_attr)
+        num_nodes = x.size(0)
+        ptr = torch.searchsorted(edge_index[1], torch.arange(num_nodes + 1, device=edge_index.device)).tolist()
+        blocks, start = [], 0
+        while start < num_nodes:
+            stop = max(bisect.bisect_right(ptr, ptr[start] + max_edges) - 1, start + 1)
+            blocks.append((start, stop))
+            start = stop
+
+        x = self.embed_nodes(x)
+        for conv, residual in self.conv_stack():
+            out = []
+            for start, stop in blocks:
+                src = edge_index[0, ptr[start]:ptr[stop]]
+                sources, local_src = torch.unique(src, return_inverse=True)
+                local_edges = torch.stack([local_src, edge_index[1, ptr[start]:ptr[stop]] - start])
+                h = conv((x[sources], x[start:stop]), local_edges, edge_attr[ptr[start]:ptr[stop]])
+                out.append(self.conv_step(x[start:stop], h, residual))
+            x = torch.cat(out)
+        return x
+
+    @torch.no_grad()
+    def predict_supercell(self, structure, cutoff=3.5, lattice=None, max_edges=65536, per_atom=False):
+        """predict_structures for one large supercell (an Atoms or CIF path) in bounded memory.
+
+        The graph is featurized once and run through encode_chunked; peak
+        memory grows with the atom count and max_edges rather than with the
+        total number of edges. With readout='node' and per_atom=True the
+        [N] per-atom outputs are returned instead of their mean.
+        """
+        was_training = self.training
+        self.eval()
+        data = atoms_to_data(structure, cutoff, lattice).to(self.device)
+        x = self.encode_chunked(data.x, data.edge_index, data.edge_attr, max_edges)
+        out = torch.clip(self.readout_head(x, None), self.YMIN, self.YMAX)
+        self.train(was_training)
+        if self.readout != 'node':
+            return out[0]
+        return out if per_atom else out.mean()
+
     def configure_optimizers(self):
         adam = torch.optim.Adam(self.parameters(), lr=self.lr, weight_decay=self.wd)
         slr = torch.optim.lr_scheduler.CosineAnnealingLR(adam, self.epochs)
@@ -29,6 +29,7 @@ class GTCNlayer(MessagePassing):
         edge_dim: Optional[int] = None,
         bias: bool = True,
         root_weight: bool = True,
+        mode: str = 'scatter',
         **kwargs,
     ):
         kwargs.setdefault('aggr', 'add')
@@ -43,6 +44,10 @@ class GTCNlayer(MessagePassing):
         self.dropout = dropout
         self.edge_dim = edge_dim
         self._alpha = None
+        self._edge_cache = None
+        if mode not in ('scatter', 'dense'):
+            raise ValueError(f"mode must be 'scatter' or 'dense', not {mode!r}")
+        self.mode = mode
 
         if isinstance(in_channels, int):
             in_channels = (in_channels, in_channels)
@@ -104,9 +109,14 @@ class GTCNlayer(MessagePassing):
         key = self.lin_key(x[0]).view(-1, H, C)
         value = self.lin_value(x[0]).view(-1, H, C)
 
-        # propagate_type: (query: Tensor, key:Tensor, value: Tensor, edge_attr: OptTensor) # noqa
-        out = self.propagate(edge_index, query=query, key=key, value=value,
-                             edge_attr=edge_attr, size=None)
+        out = None
+        if self.mode == 'dense' and isinstance(edge_index, Tensor):
+            out = self._dense_attention(query, key, value, edge_index, edge_attr)
+        if out is None:
+            edge_emb = self.edge_embedding(edge_attr)
+            # propagate_type: (query: Tensor, key:Tensor, value: Tensor, edge_emb: OptTensor) # noqa
+            out = self.propagate(edge_index, query=query, key=key, value=value,
+                                 edge_emb=edge_emb, size=None)
 
         alpha = self._alpha
         self._alpha = None
@@ -134,15 +144,42 @@ class GTCNlayer(MessagePassing):
         else:
             return out
 
+    def edge_embedding(self, edge_attr: OptTensor) -> OptTensor:
+        r"""Projected edge features :obj:`lin_edge(edge_attr)` as [E, H, C].
+
+        Outside training the result is kept and reused for as long as the
+        same, unmodified :obj:`edge_attr` tensor comes back and the weights
+        have not changed, so repeated inference on one graph projects its
+        edges once per layer.
+        """
+        if self.lin_edge is None:
+            return None
+        assert edge_attr is not None
+        weight = self.lin_edge.weight
+        # inference-mode tensors have no version counter to key the cache on
+        use_cache = not self.training and not edge_attr.is_inference()
+        cache = self._edge_cache
+        if (use_cache and cache is not None and cache[0] is edge_attr
+                and cache[1] == edge_attr._version and cache[2] == weight._version):
+            return cache[3]
+        edge_emb = self.lin_edge(edge_attr).view(-1, self.heads, self.out_channels)
+        self._edge_cache = (edge_attr, edge_attr._version, weight._version, edge_emb) if use_cache else None
+        return edge_emb
+
+    def train(self, mode: bool = True):
+        self._edge_cache = None
+        return super().train(mode)
+
     def message(self, query_i: Tensor, key_j: Tensor, value_j: Tensor,
-                edge_attr: OptTensor, index: Tensor, ptr: OptTensor,
+                edge_emb: OptTensor, index: Tensor, ptr: OptTensor,
                 size_i: Optional[int]) -> Tensor:
 
-        if self.lin_edge is not None:
-            assert edge_attr is not None
-            edge_attr = self.lin_edge(edge_attr).view(-1, self.heads,
-                                                      self.out_channels)
-            key_j += edge_attr
+        # key_j/value_j are fresh gathers; without autograd they can be
+        # updated in place, otherwise stay out of place
+        inplace = not torch.is_grad_enabled()
+
+        if edge_emb is not None:
+            key_j = key_j.add_(edge_emb) if inplace else key_j + edge_emb
 
         alpha = (query_i * key_j).sum(dim=-1) / math.sqrt(self.out_channels)
         alpha = softmax(alpha, index, ptr, size_i)
@@ -150,10 +187,62 @@ class GTCNlayer(MessagePassing):
         alpha = F.dropout(alpha, p=self.dropout, training=self.training)
 
         out = value_j
-        if edge_attr is not None:
-            out += edge_attr
+        if edge_emb is not None:
+            out = out.add_(edge_emb) if inplace else out + edge_emb
+
+        alpha = alpha.view(-1, self.heads, 1)
+        return out.mul_(alpha) if inplace else out * alpha
+
+    def _dense_attention(self, query: Tensor, key: Tensor, value: Tensor,
+                         edge_index: Tensor, edge_attr: OptTensor) -> Optional[Tensor]:
+        r"""Attention over a fixed-degree neighbourhood without scatter.
+
+        When every target node has the same in-degree k (ideal FCC/BCC
+        lattices), the incoming edges are laid out as a dense [N, k] neighbour
+        table and attention becomes a batched contraction plus a softmax over
+        the k axis; the edge projection is folded into the query/output side
+        instead of being materialized per edge. Returns :obj:`None` if the
+        degrees differ, so the caller falls back to :meth:`propagate`.
+        """
+        H, C = self.heads, self.out_channels
+        N, E = query.size(0), edge_index.size(1)
+        if N == 0 or E % N != 0:
+            return None
+        k = E // N
+
+        src, dst = edge_index[0], edge_index[1]
+        perm = None
+        if E > 1 and bool((dst[1:] < dst[:-1]).any()):
+            perm = torch.argsort(dst, stable=True)
+            src, dst = src[perm], dst[perm]
+        expected = torch.arange(N, device=dst.device).repeat_interleave(k)
+        if not torch.equal(dst, expected):
+            return None
+
+        nbr = src.view(N, k)
+        alpha = (key[nbr] * query.unsqueeze(1)).sum(dim=-1)
+        if self.lin_edge is not None:
+            assert edge_attr is not None
+            if perm is not None:
+                edge_attr = edge_attr[perm]
+            # lin_edge is linear without bias, so the [E, H, C] edge embedding
+            # is never built: q.(W a) = (W^T q).a and sum_k alpha_k W a_k = W sum_k alpha_k a_k
+            weight = self.lin_edge.weight.view(H, C, -1)
+            edge_attr = edge_attr.view(N, k, -1)
+            query_edge = torch.einsum('nhc,hcd->nhd', query, weight)
+            alpha = alpha + torch.einsum('nkd,nhd->nkh', edge_attr, query_edge)
+
+        alpha = (alpha / math.sqrt(C)).softmax(dim=1)
+        flat_alpha = alpha.reshape(E, H)
+        if perm is not None:
+            flat_alpha = torch.empty_like(flat_alpha).index_copy_(0, perm, flat_alpha)
+        self._alpha = flat_alpha
+        alpha = F.dropout(alpha, p=self.dropout, training=self.training)
 
-        out *= alpha.view(-1, self.heads, 1)
+        out = (alpha.unsqueeze(-1) * value[nbr]).sum(dim=1)
+        if self.lin_edge is not None:
+            edge_sum = torch.einsum('nkh,nkd->nhd', alpha, edge_attr)
+            out = out + torch.einsum('nhd,hcd->nhc', edge_sum, weight)
         return out
 
     def __repr__(self) -> str:
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import argparse
+from time import perf_counter
+import pytorch_lightning as pl
+from pytorch_lightning.callbacks import TQDMProgressBar
+from headata import get_dl
+from models.GTCN import GTCN
+
+
+class StepTimer(pl.Callback):
+    """Wall time of the training steps after the first `warmup` ones."""
+
+    def __init__(self, warmup=5):
+        self.warmup = warmup
+        self.steps = 0
+        self.start = None
+        self.end = None
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        self.steps += 1
+        if self.steps == self.warmup:
+            self.start = perf_counter()
+        self.end = perf_counter()
+
+    def steps_per_second(self):
+        timed = self.steps - self.warmup
+        return timed / (self.end - self.start) if timed > 0 else float('nan')
+
+
+def steps_per_second(config, data_path, Total_num, splitpara, steps=50, warmup=5, accelerator='cpu',
+                     progress_bar=True):
+    """Training throughput of GTCN on the cached HEADataset, as train.train runs it.
+
+    Runs `steps` optimizer steps (validation off) with the same progress bar
+    as train.train and returns steps/sec over all but the first `warmup`.
+    """
+    pl.seed_everything(0)
+    model = GTCN(config)
+    train_dl, _ = get_dl(config, data_path, Total_num, splitpara)
+    timer = StepTimer(warmup)
+    callbacks = [timer] + ([TQDMProgressBar(refresh_rate=1)] if progress_bar else [])
+    trainer = pl.Trainer(accelerator=accelerator, devices=1, max_steps=steps, limit_val_batches=0,
+                         logger=False, enable_checkpointing=False, enable_progress_bar=progress_bar,
+                         callbacks=callbacks)
+    trainer.fit(model, train_dataloaders=train_dl)
+    return timer.steps_per_second()
+
+
+if __name__ == "__main__":
+    from utils import utils
+
+    parser = argparse.ArgumentParser(description='GTCN training steps/sec')
+    parser.add_argument('--data', '-d', dest='data', default='data')
+    parser.add_argument('--config', '-c', dest='config', default='test.yaml')
+    parser.add_argument('--steps', dest='steps', default=50, type=int)
+    parser.add_argument('--accelerator', '-a', dest='accelerator', default='cpu')
+    parser.add_argument('--total', dest='total', default=900, type=int)
+    parser.add_argument('--split', dest='split', default=[720, 180], type=int, nargs=2)
+    args = parser.parse_args()
+
+    config = utils.load_yaml(args.config)
+    rate = steps_per_second(config, args.data, args.total, args.split, args.steps, accelerator=args.accelerator)
+    print(f"{rate:.2f} steps/sec")
@@ -3,6 +3,7 @@
 #author: xhwan
 
 import math
+import numpy as np
 
 radius_dict = {
     'Co': 126,
@@ -57,6 +58,19 @@ energy_bcc_dict = {
 }
 
 
+elements = ['Co', 'Cr', 'Fe', 'Ni', 'Cu', 'Al', 'Ti', 'Ga', 'Mn', 'Mo']
+
+# eV/K, Boltzmann constant from R = 8.314 J/(mol K)
+K_B = 8.314*6.24151/602214
+
+radius_array = np.array([radius_dict[el] for el in elements])
+metal_point_array = np.array([metal_point_dict[el] for el in elements])
+energy_arrays = {
+    'fcc': np.array([energy_fcc_dict[el] for el in elements]),
+    'bcc': np.array([energy_bcc_dict[el] for el in elements]),
+}
+
+
 def parse_alloy_composition(composition_str):
 
     elements = composition_str.replace(',', ' ').split()
@@ -136,13 +150,64 @@ def calculate_sigma(lat_type, energy, composition_str, energy_fcc_dict, energy_b
     lat = lat_type
     composition = parse_alloy_composition(composition_str)
     TM, e_N = calculate_average_metal_point(composition_str, metal_point_dict)
-    Epure_all = read(raw.csv)
+    energy_dict = energy_fcc_dict if lat == 'fcc' else energy_bcc_dict
+    Epure_all = sum(percentage * energy_dict[element] for element, percentage in composition.items())
 
     Epure = Epure_all/e_N
     dH = energy/e_N - Epure
-    dS = -ra * (8.314*6.24151/602214)
+    ra = sum(percentage/e_N * math.log(percentage/e_N) for percentage in composition.values() if percentage > 0)
+    dS = -ra * K_B
     sigma = TM*dS/abs(dH)
 
     return sigma, dS, dH
 
 
+def composition_matrix(composition_strs):
+    """Atom counts of many composition strings as an [N, 10] array in `elements` order."""
+    counts = np.zeros((len(composition_strs), len(elements)))
+    column = {el: i for i, el in enumerate(elements)}
+    for row, composition_str in enumerate(composition_strs):
+        for element, percentage in parse_alloy_composition(composition_str).items():
+            counts[row, column[element]] = percentage
+    return counts
+
+
+def batch_descriptors(counts, lat_type=None, energy=None):
+    """delta, average Tm, dS_mix, dH and sigma (Omega) for many alloys at once.
+
+    counts is an [N, 10] array of atom counts (or fractions) in `elements`
+    order. dH and sigma need the total energy of each structure and its
+    lattice type ('fcc'/'bcc', or one per row); without them they are NaN.
+    Matches calculate_radius_delta / calculate_sigma row by row.
+    """
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    e_N = counts.sum(axis=1)
+    c = counts / e_N[:, None]
+
+    r_ave = c @ radius_array
+    delta = np.sqrt(np.sum(c * (1 - radius_array / r_ave[:, None]) ** 2, axis=1))
+    TM = c @ metal_point_array
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ra = np.sum(np.where(c > 0, c * np.log(c), 0.0), axis=1)
+    dS = -ra * K_B
+
+    if energy is None or lat_type is None:
+        dH = np.full(len(counts), np.nan)
+    else:
+        lat_type = np.broadcast_to(np.asarray(lat_type), e_N.shape)
+        Epure = np.where(lat_type == 'fcc', c @ energy_arrays['fcc'], c @ energy_arrays['bcc'])
+        dH = np.asarray(energy, dtype=float) / e_N - Epure
+    with np.errstate(divide='ignore'):
+        sigma = TM * dS / np.abs(dH)
+
+    return {'delta': delta, 'TM': TM, 'dS': dS, 'dH': dH, 'sigma': sigma}
+
+
+def stream_descriptors(count_chunks, lat_type=None):
+    """Lazily apply batch_descriptors to a stream of [n, 10] count chunks,
+    e.g. mkhea.enumerate_alloys; yields (counts, descriptors) per chunk."""
+    for counts in count_chunks:
+        yield counts, batch_descriptors(counts, lat_type)
+
+
+
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import os
+import json
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA, TruncatedSVD
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import MinMaxScaler
+from featurestore import FeatureStore
+from hea2graph import build_graph_from_cif, graph_to_vector
+
+
+def _digest(fields):
+    key = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class EmbeddingMap:
+    """2-D t-SNE map of a FeatureStore, cached in cache_dir; HEAs added to the store
+    later are placed on the existing map instead of refitting it."""
+
+    def __init__(self, store, cache_dir="tsne_cache", where=None, n_components=50, reducer="pca",
+                 backend="sklearn", perplexity=50, learning_rate=50, n_neighbors=10, n_jobs=-1, random_state=0):
+        if reducer not in ("pca", "svd"):
+            raise ValueError(f"reducer must be 'pca' or 'svd', not {reducer!r}")
+        if backend not in ("sklearn", "opentsne"):
+            raise ValueError(f"backend must be 'sklearn' or 'opentsne', not {backend!r}")
+        self.store = store if isinstance(store, FeatureStore) else FeatureStore(store)
+        self.cache_dir = cache_dir
+        self.where = where
+        self.n_components = n_components
+        self.reducer = reducer
+        self.backend = backend
+        self.perplexity = perplexity
+        self.learning_rate = learning_rate
+        self.n_neighbors = n_neighbors
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.state = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _store_key(self):
+        # shards are append-only, so the shard list identifies the store contents
+        return f"{_digest({'where': self.where})}_{_digest({'shards': self.store.shard_ids()})}"
+
+    def _map_key(self):
+        # everything the fitted map depends on except the shards, which update() follows
+        return _digest({"where": self.where, "n_components": self.n_components, "reducer": self.reducer,
+                        "backend": self.backend, "perplexity": self.perplexity,
+                        "learning_rate": self.learning_rate, "random_state": self.random_state})
+
+    def scaled(self, refresh=False):
+        """(meta, scaled rows, (columns, scaler)) of the store, from the cache when it is current."""
+        key = self._store_key()
+        paths = [self._path(f"scaled_{key}.{ext}") for ext in ("npy", "csv", "joblib")]
+        if refresh or not all(os.path.exists(p) for p in paths):
+            meta, features = self.store.select(where=self.where)
+            columns = np.flatnonzero((features != 0).any(axis=0))
+            scaler = MinMaxScaler()
+            scaled = scaler.fit_transform(features[:, columns]).astype(np.float32)
+            del features
+            tmp_path = paths[0][:-4] + ".tmp.npy"
+            np.save(tmp_path, scaled)
+            os.replace(tmp_path, paths[0])
+            meta.to_csv(paths[1], index=False)
+            joblib.dump((columns, scaler), paths[2])
+            # only the current shard list is read back: drop older tables of the same selection
+            where_key = key.split("_")[0]
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(f"scaled_{where_key}_") and not name.startswith(f"scaled_{key}."):
+                    os.remove(self._path(name))
+        meta = pd.read_csv(paths[1])
+        return meta, np.load(paths[0], mmap_mode="r"), joblib.load(paths[2])
+
+    def _tsne(self, reduced):
+        if self.backend == "opentsne":
+            import openTSNE
+            tsne = openTSNE.TSNE(n_components=2, perplexity=self.perplexity, learning_rate=self.learning_rate,
+                                 initialization="pca", n_jobs=self.n_jobs, random_state=self.random_state)
+            embedding = tsne.fit(reduced)
+            return np.asarray(embedding), embedding
+        tsne = TSNE(n_components=2, perplexity=self.perplexity, init="pca", learning_rate=self.learning_rate,
+                    method="barnes_hut", n_jobs=self.n_jobs, random_state=self.random_state)
+        return tsne.fit_transform(reduced), None
+
+    def fit(self, refresh=False):
+        """Compute the map of every row of the store and save it; returns the map table."""
+        meta, scaled, (columns, scaler) = self.scaled(refresh)
+        n_components = min(self.n_components, scaled.shape[0] - 1, scaled.shape[1])
+        if self.reducer == "pca":
+            reducer = PCA(n_components=n_components, svd_solver="randomized", random_state=self.random_state)
+        else:
+            reducer = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        reduced = reducer.fit_transform(scaled).astype(np.float32)
+        coords, embedding = self._tsne(reduced)
+
+        tsne_map = meta.copy()
+        tsne_map["tSNE_1"], tsne_map["tSNE_2"] = coords[:, 0], coords[:, 1]
+        tsne_map["fitted"] = 1
+        self.state = {"columns": columns, "scaler": scaler, "reducer": reducer, "reduced": reduced,
+                      "coords": coords, "embedding": embedding, "backend": self.backend, "map": tsne_map,
+                      "key": self._map_key()}
+        self._save()
+        return tsne_map
+
+    def _save(self):
+        key = self.state["key"]
+        tmp_path = self._path(f"map_{key}.tmp.joblib")
+        joblib.dump(self.state, tmp_path)
+        os.replace(tmp_path, self._path(f"map_{key}.joblib"))
+        self.state["map"].to_csv(self._path(f"map_{key}.csv"), index=False)
+
+    def load(self):
+        """The saved map table, or None when fit() has not run with these settings."""
+        if self.state is None or self.state["key"] != self._map_key():
+            self.state = None
+            path = self._path(f"map_{self._map_key()}.joblib")
+            if not os.path.exists(path):
+                return None
+            self.state = joblib.load(path)
+        return self.state["map"]
+
+    def transform(self, features):
+        """Map coordinates [n, 2] of raw FeatureStore rows [n, num_features]."""
+        if self.load() is None:
+            raise RuntimeError(f"no map in {self.cache_dir}; run fit() first")
+        state = self.state
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        scaled = state["scaler"].transform(features[:, state["columns"]])
+        reduced = state["reducer"].transform(scaled).astype(np.float32)
+        if state["backend"] == "opentsne":
+            return np.asarray(state["embedding"].transform(reduced))
+        k = min(self.n_neighbors, len(state["reduced"]))
+        distances, neighbors = NearestNeighbors(n_neighbors=k).fit(state["reduced"]).kneighbors(reduced)
+        weights = 1.0 / np.maximum(distances, 1e-12)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum('nk,nkd->nd', weights, state["coords"][neighbors])
+
+    def update(self):
+        """Place the HEAs added to the store since fit() on the map; returns their rows."""
+        tsne_map = self.load()
+        if tsne_map is None:
+            raise RuntimeError(f"no map in {self.cache_dir}; run fit() first")
+        new_ids = self.store.hea_ids() - set(tsne_map["HEA_ID"].tolist())
+        if not new_ids:
+            return tsne_map.iloc[:0]
+        meta, features = self.store.select(where=self.where, hea_ids=new_ids)
+        if not len(meta):
+            return tsne_map.iloc[:0]
+        coords = self.transform(features)
+        added = meta.copy()
+        added["tSNE_1"], added["tSNE_2"] = coords[:, 0], coords[:, 1]
+        added["fitted"] = 0
+        self.state["map"] = pd.concat([tsne_map, added], ignore_index=True)
+        self._save()
+        return added
+
+    def refresh(self):
+        """fit() on first use, afterwards only update(); returns the full map table."""
+        if self.load() is None:
+            return self.fit()
+        self.update()
+        return self.state["map"]
+
+    def embed_structures(self, structures, cutoff=3.5):
+        """Map coordinates of ASE Atoms or CIF paths that are not in the store."""
+        features = [graph_to_vector(build_graph_from_cif(s, cutoff)) for s in structures]
+        return self.transform(np.stack(features))
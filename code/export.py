@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import math
+import argparse
+from typing import List
+import torch
+from torch import Tensor
+from torch.nn import Linear
+from hea2graph import (NODE_FEATURE_BLOCKS, NODE_CONTINUOUS_SCALE, NODE_FEATURE_NAMES, NODE_TOKEN_SCALE,
+                       NODE_TOKEN_OFFSET)
+
+
+def segment_sum(src: Tensor, index: Tensor, num_segments: int) -> Tensor:
+    # sum of the rows of src sharing the same index; scatter_add with an
+    # expanded index rather than index_add, which ONNX export gets wrong
+    size = [num_segments] + list(src.shape[1:])
+    expanded = index.view([-1] + [1] * (src.dim() - 1)).expand_as(src)
+    return torch.zeros(size, dtype=src.dtype, device=src.device).scatter_add(0, expanded, src)
+
+
+def segment_softmax(src: Tensor, index: Tensor, num_segments: int) -> Tensor:
+    # softmax of src [E, H] over the rows sharing the same index, like
+    # torch_geometric.utils.softmax
+    H = src.size(1)
+    seg_max = torch.full((num_segments, H), float('-inf'), dtype=src.dtype, device=src.device)
+    seg_max = seg_max.scatter_reduce(0, index.view(-1, 1).expand(-1, H), src, reduce='amax', include_self=True)
+    out = (src - seg_max.index_select(0, index)).exp()
+    seg_sum = segment_sum(out, index, num_segments)
+    return out / (seg_sum.index_select(0, index) + 1e-16)
+
+
+class AttentionLayer(torch.nn.Module):
+    """GTCNlayer (concat=True, root_weight=True) in plain torch, for inference only."""
+
+    def __init__(self, in_channels: int, out_channels: int, heads: int, edge_dim: int, beta: bool):
+        super(AttentionLayer, self).__init__()
+        self.heads = heads
+        self.out_channels = out_channels
+        self.beta = beta
+        self.lin_key = Linear(in_channels, heads * out_channels)
+        self.lin_query = Linear(in_channels, heads * out_channels)
+        self.lin_value = Linear(in_channels, heads * out_channels)
+        self.lin_edge = Linear(edge_dim, heads * out_channels, bias=False)
+        self.lin_skip = Linear(in_channels, heads * out_channels)
+        # always built so the module scripts; only used when beta is set
+        self.lin_beta = Linear(3 * heads * out_channels, 1, bias=False)
+
+    def forward(self, x: Tensor, edge_index: Tensor, edge_attr: Tensor) -> Tensor:
+        H, C = self.heads, self.out_channels
+        N = x.size(0)
+        src, dst = edge_index[0], edge_index[1]
+
+        query = self.lin_query(x).view(-1, H, C)
+        key = self.lin_key(x).view(-1, H, C)
+        value = self.lin_value(x).view(-1, H, C)
+        edge_emb = self.lin_edge(edge_attr).view(-1, H, C)
+
+        # the [E, H, C] gathers are fresh tensors and this module is never
+        # trained, so they are updated in place to save memory traffic
+        key_j = key.index_select(0, src).add_(edge_emb)
+        alpha = key_j.mul_(query.index_select(0, dst)).sum(dim=-1) / math.sqrt(C)
+        alpha = segment_softmax(alpha, dst, N)
+        msg = value.index_select(0, src).add_(edge_emb).mul_(alpha.view(-1, H, 1))
+        out = segment_sum(msg, dst, N).view(-1, H * C)
+
+        x_r = self.lin_skip(x)
+        if self.beta:
+            beta = self.lin_beta(torch.cat([out, x_r, out - x_r], dim=-1)).sigmoid()
+            return beta * x_r + (1 - beta) * out
+        return out + x_r
+
+
+class GTCNEngine(torch.nn.Module):
+    """Inference-only GTCN that needs nothing but torch.
+
+    Holds the same weights as a trained GTCN (see from_state_dict) and
+    computes the same outputs as GTCN.predict_step, with the message passing
+    written as scatter_add/scatter_reduce so the module can be compiled with
+    torch.jit.script or exported to ONNX. Both GTCN node encoders are
+    supported. forward takes the float node features of
+    hea2graph.atoms_to_arrays (or already tokenized nodes), the
+    [2, E] edge_index, the unscaled [E, 3] edge_attr and the [N] batch
+    vector; it returns one value per node with readout='node', otherwise one
+    per graph.
+    """
+
+    def __init__(self, nd_fea: int, E_node: int, max_node_fea: int, hidden: int, heads: int, edge_dim: int,
+                 layers: int, beta: bool, e_min: float, e_max: float, readout: str = 'node', cutoff: float = 3.5,
+                 node_encoder: str = 'embedding', node_dim: int = 32):
+        super(GTCNEngine, self).__init__()
+        if readout not in ('node', 'sum', 'mean', 'attention'):
+            raise ValueError(f"readout must be 'node', 'sum', 'mean' or 'attention', not {readout!r}")
+        self.node_encoder = node_encoder
+        self.Node_fea = nd_fea
+        self.En = E_node
+        self.max_node_fea = max_node_fea
+        self.YMIN = float(e_min)
+        self.YMAX = float(e_max)
+        self.readout = readout
+        # featurizer cutoff the model was trained with, read back by infer.py
+        self.cutoff = float(cutoff)
+        h_out = hidden // heads
+        self.register_buffer('edge_scale', torch.tensor([4.0, 4.0, 40.0]))
+        # both node encoders always exist so the module scripts; the unused one is left tiny
+        species = node_encoder == 'species'
+        blocks = [NODE_FEATURE_BLOCKS[b] for b in ('atomic_number', 'period', 'group')] if species else []
+        self.onehot_starts: List[int] = [b.start for b in blocks]
+        self.onehot_stops: List[int] = [b.stop for b in blocks]
+        self.continuous_start = NODE_FEATURE_BLOCKS['continuous'].start
+        self.onehot_emb = torch.nn.ModuleList([torch.nn.Embedding(b.stop - b.start, node_dim) for b in blocks])
+        self.register_buffer('node_scale', torch.tensor(NODE_CONTINUOUS_SCALE, dtype=torch.float))
+        self.node_lin = Linear(len(NODE_CONTINUOUS_SCALE), node_dim if species else 1)
+        self.emb = torch.nn.Embedding(1 if species else max_node_fea, E_node)
+        # float features -> tokens as GTCN.tokenize
+        self.register_buffer('token_scale', torch.tensor(NODE_TOKEN_SCALE, dtype=torch.float))
+        self.token_offset = NODE_TOKEN_OFFSET
+        self.token_names: List[str] = list(NODE_FEATURE_NAMES)
+        in_dim = node_dim if species else nd_fea * E_node
+        self.layer_begin = AttentionLayer(in_dim, h_out, heads, edge_dim, beta)
+        self.layers = torch.nn.ModuleList([AttentionLayer(h_out * heads, h_out, heads, edge_dim, beta)
+                                           for _ in range(layers)])
+        self.gate = Linear(h_out * heads, 1)
+        # GTCN.w and GTCN.out have no activation in between, so the whole
+        # Linear(hidden, 2048) -> Linear(2048, 1) -> Linear(1, 1) head folds
+        # into this one Linear (see fold_head)
+        self.head = Linear(h_out * heads, 1)
+
+    @classmethod
+    def from_state_dict(cls, state_dict, config, cutoff=3.5):
+        """Build an engine from a GTCN state_dict and the config it was trained with."""
+        state_dict = {k: v for k, v in state_dict.items() if k not in ('edge_scale', 'node_scale', 'token_scale')}
+        num_layers = len({k.split('.')[1] for k in state_dict if k.startswith('layers.')})
+        species = 'node_lin.weight' in state_dict
+        emb = state_dict.get('emb.weight', torch.zeros(1, config.E_node))
+        engine = cls(nd_fea=config.nd_fea, E_node=emb.size(1), max_node_fea=emb.size(0),
+                     hidden=config.hnrons, heads=config.heads, edge_dim=config.E_edge, layers=num_layers,
+                     beta='layer_begin.lin_beta.weight' in state_dict, e_min=config.e_min, e_max=config.e_max,
+                     readout=getattr(config, 'readout', 'node'), cutoff=cutoff,
+                     node_encoder='species' if species else 'embedding',
+                     node_dim=state_dict['node_lin.weight'].size(0) if species else 1)
+        state_dict.update(fold_head(state_dict))
+        # DeepGCNLayer wraps each GTCNlayer as layers.i.conv
+        renamed = {k.replace('.conv.', '.'): v for k, v in state_dict.items()}
+        missing, unexpected = engine.load_state_dict(renamed, strict=False)
+        # weights the trained model had no use for (beta gate, attention pool, the other node encoder)
+        unused = ('emb.', 'gate.') if species else ('node_lin.', 'gate.')
+        missing = [k for k in missing if not k.endswith('lin_beta.weight') and not k.startswith(unused)
+                   and k not in ('edge_scale', 'node_scale', 'token_scale')]
+        if missing or unexpected:
+            raise KeyError(f"state_dict does not match GTCN: missing {missing}, unexpected {unexpected}")
+        return engine.eval()
+
+    def embed_nodes(self, x: Tensor) -> Tensor:
+        if self.node_encoder == 'species':
+            x = x.float()
+            h = self.node_lin(x[:, self.continuous_start:] / self.node_scale)
+            for i, emb in enumerate(self.onehot_emb):
+                h = h + emb(x[:, self.onehot_starts[i]:self.onehot_stops[i]].argmax(dim=1))
+            return h
+        if x.is_floating_point():
+            x = torch.round(x * self.token_scale).long() + self.token_offset
+            if not torch.jit.is_tracing():
+                outside = ((x < 0) | (x >= self.max_node_fea)).any(dim=0)
+                if bool(outside.any()):
+                    column = int(outside.nonzero()[0])
+                    raise ValueError("node feature " + self.token_names[column] + " has tokens outside 0.."
+                                     + str(self.max_node_fea - 1))
+        return self.emb(x).view(-1, self.Node_fea * self.En)
+
+    def forward(self, x: Tensor, edge_index: Tensor, edge_attr: Tensor, batch: Tensor) -> Tensor:
+        edge_attr = edge_attr.float() / self.edge_scale
+        x = self.embed_nodes(x)
+        x = torch.relu(self.layer_begin(x, edge_index, edge_attr))
+        for layer in self.layers:
+            # GTCN.conv_stack: the 'res+' blocks are x + conv(x)
+            x = torch.relu(x + layer(x, edge_index, edge_attr))
+
+        if self.readout != 'node':
+            if torch.jit.is_tracing():
+                # ONNX export: a shape, unlike int(batch.max()), stays dynamic in the trace
+                num_graphs = torch.unique(batch).size(0)
+            else:
+                num_graphs = int(batch.max()) + 1 if batch.numel() > 0 else 0
+            if self.readout == 'attention':
+                x = x * segment_softmax(self.gate(x), batch, num_graphs)
+            pooled = segment_sum(x, batch, num_graphs)
+            if self.readout == 'mean':
+                counts = segment_sum(torch.ones_like(x[:, :1]), batch, num_graphs)
+                pooled = pooled / counts.clamp(min=1)
+            x = pooled
+
+        x1 = self.head(x)
+        x2 = torch.clip(x1, self.YMIN, self.YMAX)
+        # GTCN.predict_step clips the (x1 + x2) / 2 output once more
+        return torch.clip((x1 + x2) / 2, self.YMIN, self.YMAX).squeeze(-1)
+
+
+def fold_head(state_dict):
+    """head.weight/head.bias equal to GTCN.out(GTCN.w(x)), popping the w.*/out.* entries."""
+    w, b = state_dict.pop('w.0.weight').double(), state_dict.pop('w.0.bias').double()
+    for name in ('out.0', 'out.1'):
+        w_out, b_out = state_dict.pop(f'{name}.weight').double(), state_dict.pop(f'{name}.bias').double()
+        w, b = w_out @ w, w_out @ b + b_out
+    return {'head.weight': w.float(), 'head.bias': b.float()}
+
+
+def load_state_dict(model):
+    """state_dict of a GTCN instance, a Lightning checkpoint path or a (saved) state_dict."""
+    if isinstance(model, torch.nn.Module):
+        # GTCNEngine unrolls the layers as GTCN.conv_stack does
+        model.conv_stack()
+        return model.state_dict()
+    if isinstance(model, dict):
+        return model
+    state = torch.load(model, map_location='cpu', weights_only=False)
+    return state.get('state_dict', state)
+
+
+def example_inputs(nd_fea=77, num_nodes=4):
+    # tiny ring graph used to trace the ONNX export; all axes are dynamic
+    x = torch.zeros(num_nodes, nd_fea)
+    src = torch.arange(num_nodes)
+    dst = (src + 1) % num_nodes
+    edge_index = torch.stack([torch.cat([src, dst]), torch.cat([dst, src])])
+    edge_attr = torch.ones(edge_index.size(1), 3)
+    return x, edge_index, edge_attr, torch.zeros(num_nodes, dtype=torch.long)
+
+
+def quantize_engine(engine, min_in_features=16):
+    """Copy of a GTCNEngine with its attention projections dynamically quantized to INT8.
+
+    Weights are stored as qint8 and activations are quantized on the fly
+    per batch, so no calibration data is needed; CPU only. Only the
+    key/query/value/skip/beta Linears of the attention layers with at least
+    min_in_features inputs are converted: lin_edge sees just the 3 edge
+    features and loses most precision when they share one per-tensor scale,
+    and the folded head is a single Linear(hidden, 1). quantize.py measures
+    the accuracy drift and speedup against the fp32 engine.
+    """
+    qconfig = torch.ao.quantization.default_dynamic_qconfig
+    spec = {name: qconfig for name, module in engine.named_modules()
+            if name.startswith(('layer_begin.', 'layers.'))
+            and isinstance(module, Linear) and module.in_features >= min_in_features}
+    return torch.ao.quantization.quantize_dynamic(engine, spec, dtype=torch.qint8)
+
+
+def export_torchscript(model, config, output_path, cutoff=3.5, quantize=False):
+    """Compile the GTCN weights into a TorchScript file runnable with infer.py.
+
+    quantize=True exports the dynamic INT8 engine (see quantize_engine).
+    """
+    engine = GTCNEngine.from_state_dict(load_state_dict(model), config, cutoff)
+    if quantize:
+        engine = quantize_engine(engine)
+    scripted = torch.jit.script(engine)
+    scripted.save(output_path)
+    return scripted
+
+
+def export_onnx(model, config, output_path, cutoff=3.5, opset_version=18):
+    """Export the GTCN weights to ONNX (needs the onnx package; run it with onnxruntime).
+
+    The graph inputs are x [N, nd_fea], edge_index [2, E], edge_attr [E, 3]
+    and batch [N], all with dynamic sizes; batch is pruned from the graph
+    with readout='node'. The cutoff and readout are kept in the model's
+    metadata for infer.py.
+    """
+    import onnx
+
+    engine = GTCNEngine.from_state_dict(load_state_dict(model), config, cutoff)
+    with torch.no_grad():
+        torch.onnx.export(engine, example_inputs(config.nd_fea), output_path, dynamo=False,
+                          opset_version=opset_version,
+                          input_names=['x', 'edge_index', 'edge_attr', 'batch'], output_names=['energy'],
+                          dynamic_axes={'x': {0: 'nodes'}, 'edge_index': {1: 'edges'},
+                                        'edge_attr': {0: 'edges'}, 'batch': {0: 'nodes'},
+                                        'energy': {0: 'outputs'}})
+    onnx_model = onnx.load(output_path)
+    onnx.helper.set_model_props(onnx_model, {'cutoff': str(engine.cutoff), 'readout': engine.readout})
+    onnx.save(onnx_model, output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    from utils import utils
+
+    parser = argparse.ArgumentParser(description='Export a trained GTCN for inference')
+    parser.add_argument('checkpoint')
+    parser.add_argument('output')
+    parser.add_argument('--config', default='test.yaml')
+    parser.add_argument('--cutoff', default=3.5, type=float)
+    parser.add_argument('--onnx', action='store_true')
+    parser.add_argument('--int8', action='store_true', help='dynamic INT8 quantization (TorchScript only)')
+    args = parser.parse_args()
+
+    config = utils.load_yaml(args.config)
+    if args.onnx:
+        export_onnx(args.checkpoint, config, args.output, args.cutoff)
+    else:
+        export_torchscript(args.checkpoint, config, args.output, args.cutoff, quantize=args.int8)
+    print(f"exported {args.checkpoint} -> {args.output}")
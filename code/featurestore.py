@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+
+META_COLUMNS = ["HEA_ID", "Phase", "Lattice_Type", "Includes_Ga"]
+
+# column blocks of the graph_to_vector layout (max_nodes=128, max_edges=896)
+FEATURE_BLOCKS = {
+    "graph": slice(0, 2),
+    "nodes": slice(2, 2 + 128 * 77),
+    "edges": slice(2 + 128 * 77, 2 + 128 * 77 + 896 * 3),
+}
+
+
+class FeatureStore:
+    """Sharded binary feature table keyed by HEA_ID.
+
+    Every shard is a float64 `shard_XXXXX.npy` matrix plus a small
+    `shard_XXXXX.csv` holding the META_COLUMNS of its rows. The csv is
+    written last, so a shard only counts once both files are complete.
+    Feature matrices are opened memory-mapped, and select() reads only the
+    rows and columns asked for.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._index = None
+
+    def shard_ids(self):
+        paths = glob.glob(os.path.join(self.root, "shard_[0-9][0-9][0-9][0-9][0-9].csv"))
+        return sorted(int(os.path.basename(p)[6:11]) for p in paths)
+
+    def _path(self, shard_id, ext):
+        return os.path.join(self.root, f"shard_{shard_id:05d}.{ext}")
+
+    def append(self, meta, features):
+        """Write one shard; meta is a list of (HEA_ID, Phase, Lattice_Type, Includes_Ga)."""
+        shard_ids = self.shard_ids()
+        shard_id = shard_ids[-1] + 1 if shard_ids else 0
+
+        features = np.asarray(features, dtype=np.float64)
+        tmp_path = self._path(shard_id, "tmp.npy")
+        np.save(tmp_path, features)
+        os.replace(tmp_path, self._path(shard_id, "npy"))
+
+        meta = pd.DataFrame(list(meta), columns=META_COLUMNS)
+        tmp_path = self._path(shard_id, "tmp.csv")
+        meta.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self._path(shard_id, "csv"))
+
+        self._index = None
+        return shard_id
+
+    @property
+    def index(self):
+        """META_COLUMNS of every stored row, plus the shard and row it lives in."""
+        if self._index is None:
+            frames = []
+            for shard_id in self.shard_ids():
+                meta = pd.read_csv(self._path(shard_id, "csv"))
+                meta["shard"] = shard_id
+                meta["row"] = np.arange(len(meta))
+                frames.append(meta)
+            if frames:
+                self._index = pd.concat(frames, ignore_index=True)
+            else:
+                self._index = pd.DataFrame(columns=META_COLUMNS + ["shard", "row"])
+        return self._index
+
+    def hea_ids(self):
+        return set(self.index["HEA_ID"].tolist())
+
+    def num_features(self):
+        shard_ids = self.shard_ids()
+        if not shard_ids:
+            return 0
+        return np.load(self._path(shard_ids[0], "npy"), mmap_mode="r").shape[1]
+
+    def _columns(self, columns):
+        if columns is None:
+            return np.arange(self.num_features())
+        if isinstance(columns, (str, slice)):
+            columns = [columns]
+        cols = []
+        for c in columns:
+            if isinstance(c, slice):
+                cols.extend(range(self.num_features())[c])
+            elif isinstance(c, str) and c in FEATURE_BLOCKS:
+                cols.extend(range(self.num_features())[FEATURE_BLOCKS[c]])
+            elif isinstance(c, str):
+                cols.append(int(c.split("_")[1]) - 1)
+            else:
+                cols.append(int(c))
+        return np.asarray(cols, dtype=np.int64)
+
+    def select(self, columns=None, where=None, hea_ids=None):
+        """Return (meta, features) for the matching rows, in HEA_ID order.
+
+        columns: None for all, or any mix of Feature_k names, 0-based column
+        positions, slices and FEATURE_BLOCKS names ("graph", "nodes", "edges").
+        where: dict of META_COLUMNS filters, e.g. {"Lattice_Type": "fcc",
+        "Includes_Ga": 1}; a list value matches any of its entries.
+        hea_ids: optional iterable restricting the rows by HEA_ID.
+        """
+        index = self.index
+        mask = np.ones(len(index), dtype=bool)
+        for col, value in (where or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                mask &= index[col].isin(list(value)).to_numpy()
+            else:
+                mask &= (index[col] == value).to_numpy()
+        if hea_ids is not None:
+            mask &= index["HEA_ID"].isin(list(hea_ids)).to_numpy()
+        rows = index[mask].sort_values("HEA_ID")
+
+        cols = self._columns(columns)
+        out = np.empty((len(rows), len(cols)), dtype=np.float64)
+        positions = np.arange(len(rows))
+        shard_of_row = rows["shard"].to_numpy()
+        row_in_shard = rows["row"].to_numpy()
+        for shard_id in np.unique(shard_of_row):
+            features = np.load(self._path(shard_id, "npy"), mmap_mode="r")
+            take = shard_of_row == shard_id
+            out[positions[take]] = features[np.ix_(row_in_shard[take], cols)]
+
+        return rows[META_COLUMNS].reset_index(drop=True), out
+
+    def to_frame(self, columns=None, where=None, hea_ids=None):
+        """select() as one DataFrame laid out like hea_train_features.csv."""
+        meta, features = self.select(columns, where, hea_ids)
+        names = [f"Feature_{c+1}" for c in self._columns(columns)]
+        return pd.concat([meta, pd.DataFrame(features, columns=names)], axis=1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import os
+from time import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from hea2graph import build_graph_from_cif, graph_to_vector
+from featurestore import FeatureStore, META_COLUMNS
+from heaarchive import StructureArchive
+
+
+def featurize_chunk(rows, cif_folder, cutoff, archive_path=None):
+    """Featurize one chunk of hea_summary rows; runs inside a worker process."""
+    archive = StructureArchive(archive_path) if archive_path is not None else None
+    meta, vectors = [], []
+    for hea_id, phase, lattice_type, includes_ga in rows:
+        if archive is not None:
+            if hea_id not in archive:
+                print(f"Warning: HEA {hea_id} not found in {archive_path}.")
+                continue
+            structure = archive[hea_id]
+        else:
+            structure = os.path.join(cif_folder, f"hea{hea_id}.cif")
+            if not os.path.exists(structure):
+                print(f"Warning: CIF file {structure} not found.")
+                continue
+        graph = build_graph_from_cif(structure, cutoff=cutoff)
+        meta.append((hea_id, phase, lattice_type, includes_ga))
+        vectors.append(graph_to_vector(graph))
+    return meta, vectors
+
+
+def featurize_all_heas(cif_folder="trainheas", summary_file="hea_summary.csv", store_dir="hea_features",
+                       cutoff=3.5, workers=None, chunk_size=64, archive_path=None):
+    """Featurize every HEA in summary_file into the FeatureStore at store_dir.
+
+    Structures are read from cif_folder/hea{HEA_ID}.cif, or from the
+    heaarchive.StructureArchive at archive_path when one is given.
+
+    Chunks of chunk_size structures are spread over a process pool of
+    `workers` processes (default: all cores). Each finished chunk is written
+    as its own shard, and HEA_IDs already in the store are skipped, so an
+    interrupted run resumes where it stopped.
+    """
+    store = FeatureStore(store_dir)
+    hea_summary = pd.read_csv(summary_file)
+
+    finished = store.hea_ids()
+    rows = [tuple(r) for r in hea_summary[META_COLUMNS].itertuples(index=False)
+            if r.HEA_ID not in finished]
+    total = len(rows)
+    print(f"{len(finished)} HEAs already featurized, {total} to go.")
+    if total == 0:
+        return store
+
+    chunks = [rows[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+    start = time()
+    processed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(featurize_chunk, chunk, cif_folder, cutoff, archive_path): len(chunk) for chunk in chunks}
+        for future in as_completed(futures):
+            meta, vectors = future.result()
+            processed += futures[future]
+            if meta:
+                store.append(meta, vectors)
+            elapsed = time() - start
+            print(f"featurized {processed}/{total} in {elapsed:.1f} s")
+
+    return store
+
+
+if __name__ == "__main__":
+    featurize_all_heas()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import torch
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+from hea2graph import atoms_to_arrays
+
+
+def atoms_to_data(structure, cutoff=3.5, lattice=None):
+    """Featurize an ASE Atoms (or a CIF path) straight into a PyG Data.
+
+    Same features as build_graph_from_cif, but no networkx graph is built:
+    x is the [N, 77] node feature matrix, edge_index/edge_attr hold every
+    undirected edge in both directions with (length, electronegativity_diff,
+    mismatch), sorted by target node, and volume/density are graph-level
+    tensors. lattice ('fcc' or 'bcc') is needed for supercells other than
+    the 108/128-atom ones.
+    """
+    graph = atoms_to_arrays(structure, cutoff, lattice=lattice)
+    return Data(x=torch.as_tensor(graph['node_features'], dtype=torch.float),
+                edge_index=torch.as_tensor(graph['edge_index'], dtype=torch.long),
+                edge_attr=torch.as_tensor(graph['edge_attr'], dtype=torch.float),
+                volume=torch.tensor([graph['volume']], dtype=torch.float),
+                density=torch.tensor([graph['density']], dtype=torch.float),
+                num_nodes=len(graph['node_features']))
+
+
+def get_loader(structures, cutoff=3.5, batch_size=32, shuffle=False, lattice=None):
+    data_list = [atoms_to_data(s, cutoff, lattice) for s in structures]
+    return DataLoader(data_list, batch_size=batch_size, shuffle=shuffle)
+
+
+if __name__ == "__main__":
+    data = atoms_to_data('hea.cif', cutoff=3.5)
+    print(data)
@@ -2,12 +2,15 @@
 # -*- coding:utf-8 -*-
 #author: xhwan
 
+import os
+import warnings
+from collections import OrderedDict
 import numpy as np
-import pandas as pd
-import networkx as nx
+from ase import Atoms
 from ase.io import read
-from scipy.spatial.distance import cdist
-import matplotlib.pyplot as plt
+from ase.geometry.geometry import general_find_mic
+from scipy.spatial import cKDTree
+from supercell import atoms_per_cell, get_structure_type, supercell_template
 
 
 fcc_lattice_constants = {
@@ -36,8 +39,21 @@ ELEMENT_DATA = {
     'Electronaffinity': [0.660, 0.666, 0.163, 1.160, 1.227, 0.440, 0.079, 0.300, 0, 0.745]
 }
 
-df_elements = pd.DataFrame(ELEMENT_DATA)
-df_elements.set_index('Element', inplace=True)
+# per-species lookup arrays, indexed in ELEMENT_DATA['Element'] order
+SPECIES_INDEX = {el: i for i, el in enumerate(ELEMENT_DATA['Element'])}
+
+electronegativity_array = np.array(ELEMENT_DATA['Electronegativity'], dtype=float)
+
+
+def _lattice_constant_array(lattice_constants):
+    return np.array([np.nan if lattice_constants[el] == "u" else lattice_constants[el]
+                     for el in ELEMENT_DATA['Element']], dtype=float)
+
+
+lattice_constant_arrays = {
+    'fcc': _lattice_constant_array(fcc_lattice_constants),
+    'bcc': _lattice_constant_array(bcc_lattice_constants),
+}
 
 
 def encode_onehot(value, categories):
@@ -46,43 +62,370 @@ def encode_onehot(value, categories):
     return vec
 
 
-def calculate_lattice_mismatch(element1, element2, total_atoms):
-    
-    if total_atoms == 128:
-        lattice_constants = bcc_lattice_constants
-    elif total_atoms == 108:
-        lattice_constants = fcc_lattice_constants
+def _electronegativity_diff_table(lattice):
+    return np.abs(electronegativity_array[:, None] - electronegativity_array[None, :])
+
+
+def _mismatch_table(lattice):
+    a = lattice_constant_arrays[lattice]
+    with np.errstate(invalid='ignore'):
+        table = np.abs(a[:, None] - a[None, :]) / ((a[:, None] + a[None, :]) / 2)
+    # "u" (no lattice constant) on either side counts as no mismatch
+    table[np.isnan(table)] = 0.0
+    return table
+
+
+def _radius_ratio_table(lattice):
+    r = np.array(ELEMENT_DATA['AtomicRadius'], dtype=float)
+    return np.minimum(r[:, None], r[None, :]) / np.maximum(r[:, None], r[None, :])
+
+
+# symmetric species x species descriptors of an edge, as functions of the
+# lattice type; add an entry here to make a new one available to edge_attributes
+PAIR_DESCRIPTORS = {
+    'electronegativity_diff': _electronegativity_diff_table,
+    'mismatch': _mismatch_table,
+    'radius_ratio': _radius_ratio_table,
+}
+
+# the two pair descriptors of the model's edge_attr, after the length
+EDGE_DESCRIPTORS = ('electronegativity_diff', 'mismatch')
+
+_pair_tables = {}
+
+
+def pair_tables(lattice, names=EDGE_DESCRIPTORS):
+    """[10 * 10, len(names)] table of PAIR_DESCRIPTORS, row species_i * 10 + species_j."""
+    key = (lattice, tuple(names))
+    if key not in _pair_tables:
+        if lattice not in lattice_constant_arrays:
+            raise ValueError(f"lattice must be one of {sorted(lattice_constant_arrays)}, not {lattice!r}")
+        tables = [PAIR_DESCRIPTORS[name](lattice) for name in names]
+        _pair_tables[key] = np.stack(tables, axis=-1).reshape(-1, len(names))
+    return _pair_tables[key]
+
+
+def calculate_lattice_mismatch(element1, element2, total_atoms=None, lattice=None):
+    table = pair_tables(lattice or get_structure_type(total_atoms), ('mismatch',))
+    return float(table[SPECIES_INDEX[element1] * len(SPECIES_INDEX) + SPECIES_INDEX[element2], 0])
+
+
+def species_indices(atom_types):
+    return np.array([SPECIES_INDEX[el] for el in atom_types], dtype=np.int64)
+
+
+def neighbor_list(atoms, cutoff):
+    """All pairs i < j closer than cutoff under the minimum image convention.
+
+    Candidate pairs come from a KD-tree over the periodic images that can reach
+    the cutoff, so the full N x N distance matrix is never built. Returns
+    (src, dst, lengths) sorted by (src, dst).
+    """
+    positions = atoms.get_positions()
+    num_atoms = len(atoms)
+    cell = atoms.cell.complete()
+    pbc = atoms.pbc & atoms.cell.any(1)
+
+    if num_atoms < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    # wrap into the cell and collect every image shift within cutoff
+    wrapped = positions.copy()
+    repeats = np.zeros(3, dtype=int)
+    if pbc.any():
+        scaled = np.linalg.solve(cell.T, positions.T).T
+        scaled[:, pbc] -= np.floor(scaled[:, pbc])
+        wrapped = scaled @ cell
+        heights = cell.volume / np.linalg.norm(np.cross(cell[[1, 2, 0]], cell[[2, 0, 1]]), axis=1)
+        repeats[pbc] = np.ceil(cutoff / heights[pbc]).astype(int)
+
+    shifts = np.array(np.meshgrid(*[np.arange(-r, r + 1) for r in repeats],
+                                  indexing='ij')).reshape(3, -1).T
+    images = (wrapped[None, :, :] + (shifts @ cell)[:, None, :]).reshape(-1, 3)
+
+    pairs = cKDTree(wrapped).sparse_distance_matrix(
+        cKDTree(images), cutoff * (1 + 1e-8), output_type='ndarray')
+    src = pairs['i'].astype(np.int64)
+    dst = pairs['j'].astype(np.int64) % num_atoms
+    keep = src < dst
+    keys = np.unique(src[keep] * num_atoms + dst[keep])
+    src, dst = keys // num_atoms, keys % num_atoms
+
+    # same minimum-image routine get_all_distances(mic=True) ends up in, so
+    # lengths match the dense matrix bit for bit
+    vectors = positions[dst] - positions[src]
+    if pbc.any():
+        _, lengths = general_find_mic(vectors, atoms.cell, pbc=atoms.pbc)
     else:
-        raise ValueError("total atom number must be 128 (BCC) or 108 (FCC)")
+        lengths = np.linalg.norm(vectors, axis=1)
 
-    a1 = lattice_constants.get(element1)
-    a2 = lattice_constants.get(element2)
+    within = lengths < cutoff
+    return src[within], dst[within], lengths[within]
 
-    if a1 == "u" or a2 == "u":
-        return 0.0
 
-    mismatch = abs(a1 - a2) / ((a1 + a2) / 2)
-    return mismatch
+def _lattice_offsets(lattice, radius):
+    # offsets between sites of the lattice on the grid of half lattice
+    # constants, and their squared lengths, for all offsets up to radius grid
+    # steps long: FCC offsets have an even coordinate sum, BCC ones
+    # coordinates of equal parity
+    offsets = np.array(np.meshgrid(*[np.arange(-radius, radius + 1)] * 3, indexing='ij')).reshape(3, -1).T
+    if lattice == 'fcc':
+        offsets = offsets[offsets.sum(axis=1) % 2 == 0]
+    else:
+        offsets = offsets[(offsets % 2 == offsets[:, :1] % 2).all(axis=1)]
+    squared = (offsets ** 2).sum(axis=1)
+    within = squared <= radius ** 2
+    return offsets[within], squared[within]
+
+
+def shell_count(lattice, ratio):
+    """Number of neighbour shells of the FCC/BCC lattice closer than ratio lattice constants."""
+    _, squared = _lattice_offsets(lattice, int(np.ceil(2 * ratio)))
+    return len(np.unique(squared[(squared > 0) & (squared < (2 * ratio) ** 2)]))
+
+
+def _template_topology(lattice, n, shells):
+    # neighbour pairs of the ideal n x m x l supercell with lattice constant 1
+    # over its first `shells` neighbour shells, straight from the lattice
+    # offsets: O(N) in the number of sites, no distance search
+    _, scaled_positions = supercell_template(lattice, n)
+    grid_shape = 2 * np.array(n)
+    points = np.round(scaled_positions * grid_shape).astype(np.int64) % grid_shape
+    grid = np.full(grid_shape, -1, dtype=np.int64)
+    grid[tuple(points.T)] = np.arange(len(points))
+
+    radius = shells + 2
+    offsets, squared = _lattice_offsets(lattice, radius)
+    while len(np.unique(squared)) <= shells + 1:
+        radius *= 2
+        offsets, squared = _lattice_offsets(lattice, radius)
+    levels = np.unique(squared[squared > 0])
+    inner = levels[shells - 1] if shells else 0
+    within = (squared > 0) & (squared <= inner)
+    offsets = offsets[within]
+
+    src = np.repeat(np.arange(len(points)), len(offsets))
+    dst = grid[tuple(((points[:, None, :] + offsets) % grid_shape).reshape(-1, 3).T)]
+    shift = (points[:, None, :] + offsets) // grid_shape
+    keep = src < dst
+    order = np.lexsort((dst[keep], src[keep]))
+    return {'src': src[keep][order], 'dst': dst[keep][order],
+            'shift': shift.reshape(-1, 3)[keep][order].astype(np.int8),
+            'inner': np.sqrt(inner) / 2, 'outer': np.sqrt(levels[shells]) / 2,
+            'grid': grid, 'sites': scaled_positions}
+
+
+class TopologyCache:
+    """Neighbour lists of ideal FCC/BCC supercells, reused for every structure that
+    matches one up to site order, a rigid translation and small displacements."""
+
+    def __init__(self, maxsize=64, path=None, tolerance=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        lattice, n, shells = key
+        return os.path.join(self.path, f"topology_{lattice}{'x'.join(map(str, n))}_{shells}shells.npz")
+
+    def topology(self, lattice, n, shells):
+        """Cached neighbour pairs of the ideal n = (n, m, l) supercell over its first `shells` shells."""
+        n = tuple(int(r) for r in np.broadcast_to(n, 3))
+        key = (lattice, n, int(shells))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self.path is not None and os.path.exists(self._file(key)):
+            with np.load(self._file(key)) as f:
+                entry = {k: f[k] for k in f.files}
+        else:
+            entry = _template_topology(lattice, n, key[2])
+            if self.path is not None:
+                tmp_path = self._file(key)[:-4] + ".tmp.npz"
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, **entry)
+                os.replace(tmp_path, self._file(key))
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _match(self, atoms, cutoff):
+        num_atoms = len(atoms)
+        if not atoms.pbc.all():
+            return None
+        cell = np.asarray(atoms.cell)
+        lengths = np.diag(cell)
+        if (lengths <= 0).any() or np.abs(cell - np.diag(lengths)).max() > 1e-6 * lengths.max():
+            return None
+        # the lattice constant follows from the volume per atom; the cell
+        # must then hold a whole number of conventional cells along each axis
+        for lattice, per_cell in atoms_per_cell.items():
+            a = (np.prod(lengths) * per_cell / num_atoms) ** (1 / 3)
+            n = np.round(lengths / a).astype(np.int64)
+            if (n > 0).all() and per_cell * np.prod(n) == num_atoms and np.abs(lengths - n * a).max() < 1e-6 * a:
+                break
+        else:
+            return None
+        if cutoff / a >= n.min() / 2:
+            return None
+        # the pairs depend on cutoff / a only through the shells it encloses; lengths
+        # are measured from the actual positions
+        entry = self.topology(lattice, n, shell_count(lattice, cutoff / a))
+
+        grid_shape = 2 * n
+        scaled = atoms.get_positions() / lengths
+        # rigid translations do not change the neighbour list: move atom 0 onto its nearest site
+        to_sites = entry['sites'] - scaled[0]
+        to_sites -= np.round(to_sites)
+        scaled += to_sites[np.argmin(((to_sites * lengths) ** 2).sum(axis=1))]
+        site = entry['grid'][tuple((np.round(scaled * grid_shape).astype(np.int64) % grid_shape).T)]
+        if (site < 0).any() or np.bincount(site, minlength=num_atoms).max() > 1:
+            return None
+        offset = scaled - entry['sites'][site]
+        offset -= np.round(offset)
+        displacement = np.sqrt(((offset * lengths) ** 2).sum(axis=1).max())
+        margin = min(cutoff - entry['inner'] * a, entry['outer'] * a - cutoff,
+                     lengths.min() / 2 - entry['inner'] * a)
+        if 2 * displacement >= margin or (self.tolerance is not None and displacement > self.tolerance):
+            return None
+        # positions unwrapped onto their sites: sites + displacement, in units of the cell
+        return entry, site, entry['sites'][site] + offset
+
+    def neighbor_list(self, atoms, cutoff):
+        """(src, dst, lengths) as hea2graph.neighbor_list, from the cache when possible."""
+        match = self._match(atoms, cutoff)
+        if match is None:
+            self.misses += 1
+            return neighbor_list(atoms, cutoff)
+        self.hits += 1
+        entry, site, unwrapped = match
+        atom_of_site = np.empty_like(site)
+        atom_of_site[site] = np.arange(len(site))
+        src, dst = atom_of_site[entry['src']], atom_of_site[entry['dst']]
+        vectors = (unwrapped[dst] - unwrapped[src] + entry['shift']) * np.diag(atoms.cell)
+        lengths = np.linalg.norm(vectors, axis=1)
+        if (site != np.arange(len(site))).any():
+            flip = src > dst
+            src, dst = np.where(flip, dst, src), np.where(flip, src, dst)
+            order = np.lexsort((dst, src))
+            src, dst, lengths = src[order], dst[order], lengths[order]
+        return src, dst, lengths
+
+
+# default cache of atoms_to_arrays / build_graph_from_cif (in memory only)
+TOPOLOGY_CACHE = TopologyCache()
+
+
+def edge_attributes(species, src, dst, total_atoms=None, lattice=None, names=EDGE_DESCRIPTORS):
+    """Pair descriptors (electronegativity difference and lattice mismatch by
+    default) for every edge, as one gather from the lattice's pair_tables.
+
+    The lattice ('fcc' or 'bcc') is inferred from total_atoms unless given.
+    """
+    table = pair_tables(lattice or get_structure_type(total_atoms), names)
+    values = table[species[src] * len(SPECIES_INDEX) + species[dst]]
+    return tuple(values.T)
 
 
 def get_atomic_features(element):
-    data = df_elements.loc[element]
+    # one row of ELEMENT_DATA; pandas and networkx are only imported by the
+    # networkx graph path, so the array featurization (infer.py) stays light
+    data = {key: values[SPECIES_INDEX[element]] for key, values in ELEMENT_DATA.items()}
 
     onehot_atomic_number = encode_onehot(data['AtomicNumber'], list(range(1, 43)))
     onehot_period = encode_onehot(data['Period'], list(range(1, 8)))
     onehot_group = encode_onehot(data['Group'], list(range(1, 19)))
 
-    continuous_features = data[['AtomicRadius', 'AtomicMass', 'Electronegativity',
-                                'MeltingPoint', 'BoilingPoint', 'IonizationEnergy', 
-                                'Electronaffinity']].values
+    continuous_features = [data[key] for key in ['AtomicRadius', 'AtomicMass', 'Electronegativity',
+                                                 'MeltingPoint', 'BoilingPoint', 'IonizationEnergy',
+                                                 'Electronaffinity']]
     oxidation_states = [data['OxidationMax'], data['OxidationMin']]
 
     return np.concatenate([onehot_atomic_number, onehot_period, onehot_group,
                            continuous_features, oxidation_states])
 
 
-def build_graph_from_cif(cif_file, cutoff):
-    atoms = read(cif_file)
+# species index -> 76-dim get_atomic_features row
+ATOM_FEATURES = np.stack([get_atomic_features(el) for el in ELEMENT_DATA['Element']])
+
+# column blocks of the 77-dim node features: the three one-hot blocks and the
+# continuous block (7 properties, 2 oxidation states, degree)
+NODE_FEATURE_BLOCKS = {
+    'atomic_number': slice(0, 42),
+    'period': slice(42, 49),
+    'group': slice(49, 67),
+    'continuous': slice(67, 77),
+}
+
+NODE_FEATURE_NAMES = ([f'atomic_number_{i}' for i in range(1, 43)] + [f'period_{i}' for i in range(1, 8)]
+                      + [f'group_{i}' for i in range(1, 19)]
+                      + ['AtomicRadius', 'AtomicMass', 'Electronegativity', 'MeltingPoint', 'BoilingPoint',
+                         'IonizationEnergy', 'Electronaffinity', 'OxidationMax', 'OxidationMin', 'degree'])
+
+# GTCN's 'embedding' node encoder reads all 77 columns as tokens of one
+# vocabulary of config.max_fea_val + 1 entries: round(value * NODE_TOKEN_SCALE)
+# + NODE_TOKEN_OFFSET. Electronegativity, ionization energy and electron
+# affinity are scaled by 100 so the elements stay apart; the offset lifts the
+# negative OxidationMin values (down to -5) above 0
+NODE_TOKEN_SCALE = np.ones(len(NODE_FEATURE_NAMES))
+NODE_TOKEN_SCALE[[NODE_FEATURE_NAMES.index(c) for c in ('Electronegativity', 'IonizationEnergy',
+                                                        'Electronaffinity')]] = 100
+NODE_TOKEN_OFFSET = 5
+
+# fixed per-column scale of the continuous block: largest |value| in the
+# element table, and 14 neighbours (BCC first + second shell) for the degree
+NODE_CONTINUOUS_SCALE = np.append(np.abs(ATOM_FEATURES[:, 67:76]).max(axis=0), 14.0)
+
+
+def node_features(species, degree):
+    """Per-node feature matrix (atomic features + degree) gathered from ATOM_FEATURES."""
+    return np.hstack([ATOM_FEATURES[species], np.asarray(degree, dtype=float)[:, None]])
+
+
+def node_degrees(src, dst, num_atoms):
+    return np.bincount(np.concatenate([src, dst]), minlength=num_atoms)
+
+
+def atoms_to_arrays(structure, cutoff, topology_cache=None, lattice=None):
+    """NumPy graph of an Atoms object or CIF path, with no networkx graph built.
+
+    Returns a dict with node_features [N, 77], edge_index [2, 2E] holding
+    every edge in both directions sorted by target node, edge_attr [2E, 3]
+    (length, electronegativity_diff, mismatch), volume and density.
+    Neighbours come from topology_cache (TOPOLOGY_CACHE by default). The
+    lattice ('fcc' or 'bcc') of the pair descriptors is inferred from the
+    108/128 atom count unless given.
+    """
+    atoms = structure if isinstance(structure, Atoms) else read(structure)
+    total_atoms = len(atoms)
+    cell_volume = atoms.get_volume()
+    density = np.sum(atoms.get_masses()) / cell_volume
+
+    species = species_indices(atoms.get_chemical_symbols())
+    src, dst, lengths = (topology_cache or TOPOLOGY_CACHE).neighbor_list(atoms, cutoff)
+    electronegativity_diff, mismatch = edge_attributes(species, src, dst, total_atoms, lattice)
+    features = node_features(species, node_degrees(src, dst, total_atoms))
+
+    edge_index = np.stack([np.concatenate([src, dst]), np.concatenate([dst, src])])
+    edge_attr = np.stack([lengths, electronegativity_diff, mismatch], axis=1)
+    edge_attr = np.concatenate([edge_attr, edge_attr])
+    # grouped by target node, as GTCNlayer's dense attention mode expects
+    order = np.lexsort((edge_index[0], edge_index[1]))
+
+    return {'node_features': features, 'edge_index': edge_index[:, order], 'edge_attr': edge_attr[order],
+            'volume': cell_volume, 'density': density}
+
+
+def build_graph_from_cif(cif_file, cutoff, lattice=None):
+    import networkx as nx
+    atoms = cif_file if isinstance(cif_file, Atoms) else read(cif_file)
     positions = atoms.get_positions()
     atom_types = atoms.get_chemical_symbols()
     total_atoms = len(atoms)
@@ -93,31 +436,37 @@ def build_graph_from_cif(cif_file, cutoff):
 
     G = nx.Graph(volume=cell_volume, density=density)
 
-    for i, (atom, pos) in enumerate(zip(atom_types, positions)):
-        features = get_atomic_features(atom)
-        G.add_node(i, features=features)
+    species = species_indices(atom_types)
+    src, dst, lengths = TOPOLOGY_CACHE.neighbor_list(atoms, cutoff)
+    electronegativity_diff, mismatch = edge_attributes(species, src, dst, total_atoms, lattice)
+    features = node_features(species, node_degrees(src, dst, total_atoms))
 
-    distances = atoms.get_all_distances(mic=True)
+    G.add_nodes_from((i, {'features': f}) for i, f in enumerate(features))
+    G.add_edges_from(
+        (i, j, {'length': d, 'electronegativity_diff': en, 'mismatch': m})
+        for i, j, d, en, m in zip(src.tolist(), dst.tolist(), lengths, electronegativity_diff, mismatch)
+    )
 
-    for i in range(len(atom_types)):
-        for j in range(i + 1, len(atom_types)):
-            if distances[i, j] < cutoff:
-                electronegativity_diff = abs(
-                    df_elements.loc[atom_types[i], 'Electronegativity'] -
-                    df_elements.loc[atom_types[j], 'Electronegativity']
-                )
-                mismatch = calculate_lattice_mismatch(atom_types[i], atom_types[j], total_atoms)
-                G.add_edge(i, j, length=distances[i, j], 
-                           electronegativity_diff=electronegativity_diff, mismatch=mismatch)
 
-    for node in G.nodes:
-        G.nodes[node]['features'] = np.append(G.nodes[node]['features'], G.degree[node])
+    return G
 
 
-    return G
+def _check_overflow(num_nodes, num_edges, max_nodes, max_edges, on_overflow):
+    if num_nodes <= max_nodes and num_edges <= max_edges:
+        return
+    msg = (f"graph has {num_nodes} nodes / {num_edges} edges, more than "
+           f"max_nodes={max_nodes} / max_edges={max_edges}")
+    if on_overflow == 'raise':
+        raise ValueError(msg)
+    elif on_overflow == 'warn':
+        warnings.warn(msg + "; the extra nodes/edges are dropped")
+    else:
+        raise ValueError(f"on_overflow must be 'raise' or 'warn', not {on_overflow!r}")
+
 
+def graph_to_vector(G, max_nodes=128, max_edges=896, on_overflow='warn'):
+    _check_overflow(G.number_of_nodes(), G.number_of_edges(), max_nodes, max_edges, on_overflow)
 
-def graph_to_vector(G, max_nodes=128, max_edges=896):
     vector = []
 
     vector.append(G.graph.get('volume', 0))
@@ -149,6 +498,91 @@ def graph_to_vector(G, max_nodes=128, max_edges=896):
     return np.array(vector)
 
 
+def graph_to_ragged(G):
+    """Unpadded (graph_features, node_features, edge_index, edge_features) of one graph."""
+    graph_features = np.array([G.graph.get('volume', 0), G.graph.get('density', 0)], dtype=float)
+    node_features = np.array([G.nodes[i]['features'] for i in G.nodes], dtype=float).reshape(len(G), -1)
+    edges = list(G.edges(data=True))
+    edge_index = np.array([(i, j) for i, j, _ in edges], dtype=np.int64).reshape(-1, 2)
+    edge_features = np.array([(d.get('length', 0), d.get('electronegativity_diff', 0), d.get('mismatch', 0))
+                              for _, _, d in edges], dtype=float).reshape(-1, 3)
+    return graph_features, node_features, edge_index, edge_features
+
+
+class RaggedGraphs:
+    """Many graphs stored back to back in CSR layout, without padding.
+
+    Graph g owns rows node_offsets[g]:node_offsets[g+1] of node_features and
+    rows edge_offsets[g]:edge_offsets[g+1] of edge_index/edge_features;
+    edge_index is local to its graph. dense() rebuilds the padded
+    graph_to_vector layout on demand.
+    """
+
+    def __init__(self, graph_features, node_offsets, node_features, edge_offsets, edge_index, edge_features):
+        self.graph_features = graph_features
+        self.node_offsets = node_offsets
+        self.node_features = node_features
+        self.edge_offsets = edge_offsets
+        self.edge_index = edge_index
+        self.edge_features = edge_features
+
+    @classmethod
+    def from_graphs(cls, graphs):
+        parts = [graph_to_ragged(G) for G in graphs]
+        graph_features, node_features, edge_index, edge_features = zip(*parts)
+        node_offsets = np.concatenate([[0], np.cumsum([len(n) for n in node_features])]).astype(np.int64)
+        edge_offsets = np.concatenate([[0], np.cumsum([len(e) for e in edge_index])]).astype(np.int64)
+        return cls(np.stack(graph_features), node_offsets, np.concatenate(node_features),
+                   edge_offsets, np.concatenate(edge_index), np.concatenate(edge_features))
+
+    def __len__(self):
+        return len(self.graph_features)
+
+    def __getitem__(self, g):
+        n0, n1 = self.node_offsets[g], self.node_offsets[g + 1]
+        e0, e1 = self.edge_offsets[g], self.edge_offsets[g + 1]
+        return (self.graph_features[g], self.node_features[n0:n1],
+                self.edge_index[e0:e1], self.edge_features[e0:e1])
+
+    def num_nodes(self):
+        return np.diff(self.node_offsets)
+
+    def num_edges(self):
+        return np.diff(self.edge_offsets)
+
+    def dense(self, max_nodes=None, max_edges=None, on_overflow='raise'):
+        """Padded [num_graphs, 2 + max_nodes*F + max_edges*3] matrix, as graph_to_vector rows.
+
+        max_nodes/max_edges default to the largest graph, so nothing is dropped.
+        """
+        num_nodes, num_edges = self.num_nodes(), self.num_edges()
+        max_nodes = int(num_nodes.max(initial=0)) if max_nodes is None else max_nodes
+        max_edges = int(num_edges.max(initial=0)) if max_edges is None else max_edges
+        num_node_features = self.node_features.shape[1]
+
+        out = np.zeros((len(self), 2 + max_nodes * num_node_features + max_edges * 3))
+        out[:, :2] = self.graph_features
+        node_block = out[:, 2:2 + max_nodes * num_node_features].reshape(len(self), max_nodes, num_node_features)
+        edge_block = out[:, 2 + max_nodes * num_node_features:].reshape(len(self), max_edges, 3)
+        for g in range(len(self)):
+            _check_overflow(num_nodes[g], num_edges[g], max_nodes, max_edges, on_overflow)
+            _, nodes, _, edges = self[g]
+            node_block[g, :min(len(nodes), max_nodes)] = nodes[:max_nodes]
+            edge_block[g, :min(len(edges), max_edges)] = edges[:max_edges]
+        return out
+
+    def save(self, path):
+        np.savez(path, graph_features=self.graph_features, node_offsets=self.node_offsets,
+                 node_features=self.node_features, edge_offsets=self.edge_offsets,
+                 edge_index=self.edge_index, edge_features=self.edge_features)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['graph_features'], f['node_offsets'], f['node_features'],
+                       f['edge_offsets'], f['edge_index'], f['edge_features'])
+
+
 if __name__ == "__main__":
     cif_file = 'hea.cif'
 
@@ -167,4 +601,5 @@ if __name__ == "__main__":
 #    nx.draw(graph)
 #    plt.show()
     vec = graph_to_vector(graph)
+    import pandas as pd
     df = pd.DataFrame([vec])
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import os
+import glob
+import struct
+import numpy as np
+from ase import Atoms
+from ase.io import read, write
+from mkhea import elements, ELEMENT_INDEX
+
+
+MAGIC = b'HEAARCH1'
+# hea_id, number of atoms, pbc flags
+HEADER = struct.Struct('<qI3?')
+
+
+class StructureArchive:
+    """Append-only single-file container of many HEA structures.
+
+    The file is MAGIC followed by one record per structure: a HEADER, the
+    3x3 cell (float64), species as uint8 indices into mkhea.elements and the
+    Cartesian positions (float64, N x 3). Opening the archive only scans the
+    headers to build an HEA_ID -> offset index; structures are read on demand.
+    Appending the same HEA_ID again shadows the older record, and a record
+    cut short by a crash is ignored and overwritten by the next append.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        self._end = len(MAGIC)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(MAGIC)
+        self._scan()
+
+    def _scan(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a HEA structure archive")
+            offset = len(MAGIC)
+            while offset + HEADER.size <= size:
+                f.seek(offset)
+                hea_id, num_atoms, *_ = HEADER.unpack(f.read(HEADER.size))
+                end = offset + HEADER.size + 9 * 8 + num_atoms + num_atoms * 3 * 8
+                if end > size:
+                    break
+                self.offsets[hea_id] = offset
+                offset = end
+        self._end = offset
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, hea_id):
+        return hea_id in self.offsets
+
+    def ids(self):
+        return sorted(self.offsets)
+
+    def append(self, hea_id, atoms):
+        species = np.array([ELEMENT_INDEX[el] for el in atoms.get_chemical_symbols()], dtype=np.uint8)
+        record = b''.join([
+            HEADER.pack(int(hea_id), len(atoms), *[bool(p) for p in atoms.pbc]),
+            np.ascontiguousarray(atoms.cell[:], dtype='<f8').tobytes(),
+            species.tobytes(),
+            np.ascontiguousarray(atoms.positions, dtype='<f8').tobytes(),
+        ])
+        with open(self.path, 'r+b') as f:
+            f.seek(self._end)
+            f.write(record)
+            f.truncate()
+        self.offsets[int(hea_id)] = self._end
+        self._end += len(record)
+
+    def extend(self, items):
+        for hea_id, atoms in items:
+            self.append(hea_id, atoms)
+
+    def get_arrays(self, hea_id):
+        """(cell [3, 3], species [N] indices into mkhea.elements, positions [N, 3], pbc [3])."""
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[hea_id])
+            _, num_atoms, *pbc = HEADER.unpack(f.read(HEADER.size))
+            cell = np.frombuffer(f.read(9 * 8), dtype='<f8').reshape(3, 3)
+            species = np.frombuffer(f.read(num_atoms), dtype=np.uint8)
+            positions = np.frombuffer(f.read(num_atoms * 3 * 8), dtype='<f8').reshape(num_atoms, 3)
+        return cell, species, positions, np.array(pbc)
+
+    def __getitem__(self, hea_id):
+        cell, species, positions, pbc = self.get_arrays(hea_id)
+        return Atoms([elements[i] for i in species], positions=positions, cell=cell, pbc=pbc)
+
+    def items(self):
+        for hea_id in self.ids():
+            yield hea_id, self[hea_id]
+
+
+def import_cifs(archive_path, cif_folder="trainheas", hea_ids=None):
+    """Pack hea{HEA_ID}.cif files from cif_folder into the archive (all of them by default)."""
+    archive = StructureArchive(archive_path)
+    if hea_ids is None:
+        hea_ids = sorted(int(os.path.basename(p)[3:-4]) for p in glob.glob(os.path.join(cif_folder, "hea*.cif")))
+    for hea_id in hea_ids:
+        cif_path = os.path.join(cif_folder, f"hea{hea_id}.cif")
+        if os.path.exists(cif_path):
+            archive.append(hea_id, read(cif_path))
+        else:
+            print(f"Warning: CIF file {cif_path} not found.")
+    return archive
+
+
+def export_cifs(archive_path, cif_folder="trainheas", hea_ids=None):
+    """Write archived structures back out as hea{HEA_ID}.cif files."""
+    archive = StructureArchive(archive_path)
+    os.makedirs(cif_folder, exist_ok=True)
+    for hea_id in archive.ids() if hea_ids is None else hea_ids:
+        write(os.path.join(cif_folder, f"hea{hea_id}.cif"), archive[hea_id])
+
+
+if __name__ == "__main__":
+    archive = import_cifs("trainheas.heaa", "trainheas")
+    print(f"{len(archive)} structures archived in trainheas.heaa")
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+from torch_geometric.data import Data, InMemoryDataset
+from torch_geometric.loader import DataLoader
+import hea2graph
+from hea2data import atoms_to_data
+
+
+# bump when atoms_to_data or the stored targets change, so old caches are dropped
+FEATURIZER_VERSION = 3
+
+
+def featurizer_key(cutoff):
+    """Hash of everything the cached graphs depend on: cutoff and the element tables."""
+    h = hashlib.sha256()
+    h.update(f"v{FEATURIZER_VERSION};cutoff={float(cutoff)!r};".encode())
+    h.update(",".join(hea2graph.ELEMENT_DATA['Element']).encode())
+    for table in (hea2graph.electronegativity_array, hea2graph.ATOM_FEATURES,
+                  hea2graph.lattice_constant_arrays['fcc'], hea2graph.lattice_constant_arrays['bcc']):
+        h.update(np.ascontiguousarray(table, dtype=np.float64).tobytes())
+    return h.hexdigest()[:16]
+
+
+def _load_structure(args):
+    hea_id, cif_folder, archive_path, cutoff = args
+    if archive_path is not None:
+        from heaarchive import StructureArchive
+        return atoms_to_data(StructureArchive(archive_path)[hea_id], cutoff)
+    return atoms_to_data(os.path.join(cif_folder, f"hea{hea_id}.cif"), cutoff)
+
+
+class HEADataset(InMemoryDataset):
+    """Every HEA of hea_summary.csv featurized once and kept as collated tensors.
+
+    Graphs come from hea2data.atoms_to_data; each one also gets hea_id, its
+    per-atom energy y and y3, a [N] tensor of that energy for every atom,
+    which GTCN's per-node readout trains on and which collates like x.
+    energy_column holds the total energy of the supercell, as delta.py reads
+    it, and is divided by the number of atoms; pass per_atom=True when the
+    column is already per atom.
+    The collated store is written to root/processed under a name holding
+    featurizer_key(cutoff) and a hash of the summary file, so changing the
+    cutoff, the element tables or the labels builds a fresh cache instead
+    of reusing a stale one. Rows are kept in HEA_ID order.
+
+    With mmap=True the cached tensors are memory-mapped instead of read, so
+    processes opening the same cache (sweep.py workers) share one copy
+    through the page cache.
+    """
+
+    def __init__(self, root, cif_folder=None, summary_file=None, cutoff=3.5, energy_column="Energy (E)",
+                 per_atom=False, archive_path=None, workers=None, mmap=False, transform=None, pre_transform=None):
+        self.cif_folder = cif_folder or os.path.join(root, "trainheas")
+        self.summary_file = summary_file or os.path.join(root, "hea_summary.csv")
+        self.cutoff = cutoff
+        self.energy_column = energy_column
+        self.per_atom = per_atom
+        self.archive_path = archive_path
+        self.workers = workers
+        self.mmap = mmap
+        with open(self.summary_file, 'rb') as f:
+            summary_hash = hashlib.sha256(f.read() + f"{energy_column};{per_atom}".encode()).hexdigest()[:8]
+        self.key = f"{featurizer_key(cutoff)}_{summary_hash}"
+        super(HEADataset, self).__init__(root, transform, pre_transform)
+        self.load(self.processed_paths[0])
+
+    @property
+    def raw_file_names(self):
+        return []
+
+    @property
+    def processed_file_names(self):
+        return [f"hea_graphs_{self.key}.pt"]
+
+    def download(self):
+        pass
+
+    def load(self, path, data_cls=Data):
+        if not self.mmap:
+            return super(HEADataset, self).load(path, data_cls)
+        data, self.slices, data_cls = torch.load(path, mmap=True, weights_only=False)
+        self.data = data_cls.from_dict(data)
+
+    def process(self):
+        summary = pd.read_csv(self.summary_file).sort_values("HEA_ID")
+        if self.energy_column not in summary:
+            raise KeyError(f"{self.summary_file} has no {self.energy_column!r} column")
+        if self.archive_path is None:
+            exists = [os.path.exists(os.path.join(self.cif_folder, f"hea{i}.cif")) for i in summary["HEA_ID"]]
+            for hea_id in summary["HEA_ID"][~np.array(exists, dtype=bool)]:
+                print(f"Warning: CIF file {os.path.join(self.cif_folder, f'hea{hea_id}.cif')} not found.")
+            summary = summary[exists]
+
+        jobs = [(int(i), self.cif_folder, self.archive_path, self.cutoff) for i in summary["HEA_ID"]]
+        print(f"Featurizing {len(jobs)} HEAs into {self.processed_paths[0]}")
+        if self.workers == 1:
+            data_list = [_load_structure(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                data_list = list(pool.map(_load_structure, jobs, chunksize=16))
+
+        for data, hea_id, energy in zip(data_list, summary["HEA_ID"], summary[self.energy_column]):
+            if not self.per_atom:
+                energy = energy / data.num_nodes
+            data.hea_id = torch.tensor([hea_id])
+            data.y = torch.tensor([energy], dtype=torch.float)
+            data.y3 = torch.full((data.num_nodes,), energy, dtype=torch.float)
+        if self.pre_transform is not None:
+            data_list = [self.pre_transform(d) for d in data_list]
+        self.save(data_list, self.processed_paths[0])
+
+
+def graph_sizes(dataset):
+    """(num_nodes, num_edges) int arrays for every graph of a (sliced) dataset."""
+    if isinstance(dataset, InMemoryDataset) and dataset.slices is not None:
+        idx = np.asarray(dataset.indices())
+        node_ptr = dataset.slices['x'].numpy()
+        edge_ptr = dataset.slices['edge_index'].numpy()
+        return (node_ptr[idx + 1] - node_ptr[idx]), (edge_ptr[idx + 1] - edge_ptr[idx])
+    sizes = np.array([(d.num_nodes, d.num_edges) for d in dataset], dtype=np.int64).reshape(-1, 2)
+    return sizes[:, 0], sizes[:, 1]
+
+
+class BudgetBatchSampler(torch.utils.data.Sampler):
+    """Batches packed up to a node and/or edge budget instead of a graph count.
+
+    Graphs are taken in (shuffled) order and added to the current batch
+    until the next one would push it past max_nodes or max_edges; a graph
+    larger than the budget on its own forms a single-graph batch. With
+    groups (one label per graph, e.g. num_nodes: 108 for FCC, 128 for BCC
+    supercells) every batch holds a single group, which keeps the degree
+    uniform for GTCNlayer's dense attention mode; batches of the different
+    groups are then interleaved in random order. The packing is done once;
+    each epoch only reorders the batches, so len() stays fixed. Pass to a
+    DataLoader as batch_sampler.
+    """
+
+    def __init__(self, num_nodes, num_edges, max_nodes=None, max_edges=None, groups=None, shuffle=True, seed=0):
+        if max_nodes is None and max_edges is None:
+            raise ValueError("BudgetBatchSampler needs max_nodes and/or max_edges")
+        self.num_nodes = np.asarray(num_nodes)
+        self.num_edges = np.asarray(num_edges)
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.groups = None if groups is None else np.asarray(groups)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self._batches = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _pack(self, order):
+        batches, batch, nodes, edges = [], [], 0, 0
+        for i in order:
+            n, e = self.num_nodes[i], self.num_edges[i]
+            over = ((self.max_nodes is not None and nodes + n > self.max_nodes)
+                    or (self.max_edges is not None and edges + e > self.max_edges))
+            if batch and over:
+                batches.append(batch)
+                batch, nodes, edges = [], 0, 0
+            batch.append(int(i))
+            nodes += n
+            edges += e
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def batches(self):
+        if self._batches is None:
+            rng = np.random.default_rng(self.seed)
+            order = rng.permutation(len(self.num_nodes)) if self.shuffle else np.arange(len(self.num_nodes))
+            if self.groups is None:
+                batches = self._pack(order)
+            else:
+                batches = []
+                for group in np.unique(self.groups):
+                    batches.extend(self._pack(order[self.groups[order] == group]))
+            self._batches = batches
+        return self._batches
+
+    def __iter__(self):
+        batches = self.batches()
+        if self.shuffle:
+            # repacking would change the number of batches: only reorder them
+            rng = np.random.default_rng([self.seed, self.epoch])
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+            self.set_epoch(self.epoch + 1)
+        return iter(batches)
+
+    def __len__(self):
+        return len(self.batches())
+
+
+def split_indices(Total_num, splitpara, fold=0, seed=0):
+    """(train, valid) index tensors over the first Total_num graphs.
+
+    The graphs are shuffled once with `seed`; fold k takes the k-th block
+    of splitpara[1] graphs as validation and the splitpara[0] after it as
+    training, so folds 0 .. Total_num // splitpara[1] - 1 have disjoint
+    validation sets.
+    """
+    n_train, n_valid = splitpara
+    if n_train + n_valid > Total_num:
+        raise ValueError(f"splitpara {splitpara} needs more than Total_num={Total_num} graphs")
+    perm = torch.randperm(Total_num, generator=torch.Generator().manual_seed(seed))
+    perm = perm.roll(-(fold * n_valid) % Total_num)
+    valid = perm[:n_valid]
+    train = perm[n_valid:n_valid + n_train]
+    return train, valid
+
+
+def get_loader(dataset, config, shuffle):
+    """DataLoader of config.batch_size graphs, or of BudgetBatchSampler batches
+    when config.max_nodes / config.max_edges is set (config.group_lattice
+    keeps FCC and BCC supercells in separate batches)."""
+    max_nodes = getattr(config, 'max_nodes', None)
+    max_edges = getattr(config, 'max_edges', None)
+    if max_nodes is None and max_edges is None:
+        return DataLoader(dataset, batch_size=getattr(config, 'batch_size', 32), shuffle=shuffle)
+    num_nodes, num_edges = graph_sizes(dataset)
+    groups = num_nodes if getattr(config, 'group_lattice', False) else None
+    sampler = BudgetBatchSampler(num_nodes, num_edges, max_nodes, max_edges, groups, shuffle,
+                                 getattr(config, 'split_seed', 0))
+    return DataLoader(dataset, batch_sampler=sampler)
+
+
+def get_dl(config, data_path, Total_num, splitpara, fold=0, dataset=None):
+    """(train, valid) DataLoaders over the cached HEADataset at data_path.
+
+    data_path holds hea_summary.csv and trainheas/; config.cutoff,
+    config.per_atom, config.split_seed and the get_loader batching keys are used when present.
+    An already opened dataset can be passed to skip loading it again.
+    """
+    if dataset is None:
+        dataset = HEADataset(data_path, cutoff=getattr(config, 'cutoff', 3.5),
+                             per_atom=getattr(config, 'per_atom', False))
+    if Total_num > len(dataset):
+        raise ValueError(f"Total_num={Total_num} but only {len(dataset)} HEAs are in {data_path}")
+    train_idx, valid_idx = split_indices(Total_num, splitpara, fold, getattr(config, 'split_seed', 0))
+    return get_loader(dataset[train_idx], config, shuffle=True), get_loader(dataset[valid_idx], config, shuffle=False)
+
+
+def gety(dl, readout='node'):
+    """Targets of dl in loader order, lined up with trainer.predict(model, dl)."""
+    if readout == 'node':
+        return torch.cat([batch.y3 for batch in dl])
+    return torch.cat([batch.y.view(-1) for batch in dl])
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import argparse
+import itertools
+import numpy as np
+from hea2graph import atoms_to_arrays
+
+
+class TorchScriptEngine:
+    """A GTCN exported by export.export_torchscript; needs only torch."""
+
+    def __init__(self, path):
+        import torch
+        self.torch = torch
+        self.module = torch.jit.load(path, map_location='cpu').eval()
+        self.cutoff = self.module.cutoff
+        self.readout = self.module.readout
+
+    def __call__(self, x, edge_index, edge_attr, batch):
+        torch = self.torch
+        with torch.inference_mode():
+            out = self.module(torch.from_numpy(x), torch.from_numpy(edge_index),
+                              torch.from_numpy(edge_attr), torch.from_numpy(batch))
+        return out.numpy()
+
+
+class OnnxEngine:
+    """A GTCN exported by export.export_onnx; needs only onnxruntime."""
+
+    def __init__(self, path, threads=None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.cutoff = float(meta.get('cutoff', 3.5))
+        self.readout = meta.get('readout', 'node')
+        self.inputs = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, x, edge_index, edge_attr, batch):
+        feed = {'x': x, 'edge_index': edge_index, 'edge_attr': edge_attr, 'batch': batch}
+        return self.session.run(None, {name: feed[name] for name in self.inputs})[0]
+
+
+def load_engine(path, threads=None):
+    """TorchScript (.pt) or ONNX (.onnx) model written by export.py."""
+    if path.endswith('.onnx'):
+        return OnnxEngine(path, threads)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return TorchScriptEngine(path)
+
+
+def collate(graphs):
+    """Stack atoms_to_arrays graphs into one disjoint batch of numpy arrays."""
+    num_nodes = [len(g['node_features']) for g in graphs]
+    offsets = np.cumsum([0] + num_nodes[:-1])
+    x = np.concatenate([g['node_features'] for g in graphs]).astype(np.float32)
+    edge_index = np.concatenate([g['edge_index'] + off for g, off in zip(graphs, offsets)], axis=1).astype(np.int64)
+    edge_attr = np.concatenate([g['edge_attr'] for g in graphs]).astype(np.float32)
+    batch = np.repeat(np.arange(len(graphs), dtype=np.int64), num_nodes)
+    return x, edge_index, edge_attr, batch
+
+
+def predict(engine, structures, batch_size=64, cutoff=None, lattice=None):
+    """One prediction per structure for an iterable of ASE Atoms or CIF paths.
+
+    Like GTCN.predict_structures: with readout='node' the per-atom outputs
+    are averaged per structure. cutoff defaults to the one stored at export;
+    lattice ('fcc' or 'bcc') is needed for cells other than 108/128 atoms.
+    """
+    cutoff = engine.cutoff if cutoff is None else cutoff
+    preds = []
+    structures = iter(structures)
+    while True:
+        chunk = list(itertools.islice(structures, batch_size))
+        if not chunk:
+            break
+        x, edge_index, edge_attr, batch = collate([atoms_to_arrays(s, cutoff, lattice=lattice) for s in chunk])
+        out = engine(x, edge_index, edge_attr, batch)
+        if engine.readout == 'node':
+            out = np.bincount(batch, weights=out) / np.bincount(batch)
+        preds.append(np.asarray(out, dtype=np.float32))
+    return np.concatenate(preds) if preds else np.zeros(0, dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Predict HEA energies with an exported GTCN')
+    parser.add_argument('model', help='.pt (TorchScript) or .onnx file written by export.py')
+    parser.add_argument('structures', nargs='*', help='CIF files')
+    parser.add_argument('--archive', help='heaarchive.StructureArchive to read structures from')
+    parser.add_argument('--ids', nargs='*', type=int, help='HEA_IDs to take from --archive (default: all)')
+    parser.add_argument('--batch-size', default=64, type=int)
+    parser.add_argument('--lattice', choices=['fcc', 'bcc'], default=None,
+                        help='lattice of supercells other than the 108/128-atom ones')
+    parser.add_argument('--threads', default=None, type=int)
+    args = parser.parse_args()
+
+    engine = load_engine(args.model, args.threads)
+    if args.archive:
+        from heaarchive import StructureArchive
+        archive = StructureArchive(args.archive)
+        names = archive.ids() if args.ids is None else args.ids
+        structures = (archive[hea_id] for hea_id in names)
+    else:
+        names = args.structures
+        structures = args.structures
+
+    for name, pred in zip(names, predict(engine, structures, args.batch_size, lattice=args.lattice)):
+        print(f"{name}\t{pred:.6f}")
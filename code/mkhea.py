@@ -4,14 +4,20 @@
 
 
 import random
+import itertools
+import numpy as np
+from scipy.stats import qmc
 from ase import Atoms
 from ase.io import write
-from ase.build import bulk, make_supercell
+from supercell import (atoms_per_cell, default_lattice_constants, get_structure_type, supercell_size,
+                       resolve_supercell, supercell_template)
 
 
 
 elements = ['Co', 'Cr', 'Fe', 'Ni', 'Cu', 'Al', 'Ti', 'Ga', 'Mn', 'Mo']
 
+ELEMENT_INDEX = {el: i for i, el in enumerate(elements)}
+
 fcc_lattice_constants = {
     "Co": 3.544, "Ga": "u", "Ni": 3.524, "Cu": 4.05, "Ti": "u",
     "Cr": "u", "Fe": 3.65, "Al": 4.05, "Mn": 3.645, "Mo": "u"
@@ -24,12 +30,10 @@ bcc_lattice_constants = {
 
 
 
-def generate_alloy(lat_type, min_elements=5, max_elements=6):
+def generate_alloy(lat_type, min_elements=5, max_elements=6, repeats=None):
 
-    if lat_type == 'fcc':
-        total_atoms = 108
-    elif lat_type == 'bcc':
-        total_atoms = 128
+    if lat_type in atoms_per_cell:
+        total_atoms = supercell_size(lat_type, repeats)
     else:
         print('lat type is wrong input')
 
@@ -54,6 +58,216 @@ def generate_alloy(lat_type, min_elements=5, max_elements=6):
     return alloy_string
 
 
+def _composition_counts(max_parts, total_atoms, min_atoms, max_atoms):
+    # counts[k, t]: ways to write t as k ordered parts, each in [min_atoms, max_atoms]
+    counts = np.zeros((max_parts + 1, total_atoms + 1), dtype=np.int64)
+    counts[0, 0] = 1
+    for k in range(1, max_parts + 1):
+        for v in range(min_atoms, max_atoms + 1):
+            counts[k, v:] += counts[k - 1, :total_atoms + 1 - v]
+    return counts
+
+
+# a composition row packs into one int64: 6 bits (counts 0..63) per element.
+# Once a larger count is added (generate_alloy gives the last element all
+# remaining atoms, and large supercells more) the index switches to complex128
+# keys: real and imaginary part are exact float64 integers of 5 elements x 10
+# bits (counts 0..1023) each
+_COUNT_BITS = 6
+_COUNT_SHIFTS = np.arange(len(elements), dtype=np.int64) * _COUNT_BITS
+_WIDE_BITS = 10
+_WIDE_SHIFTS = np.arange(len(elements) // 2, dtype=np.int64) * _WIDE_BITS
+
+
+class CompositionIndex:
+    """Index of already generated compositions ([n, 10] count rows in `elements` order),
+    kept as packed keys in a few sorted numpy blocks."""
+
+    def __init__(self, counts=None):
+        self._blocks = []
+        self._wide = False
+        if counts is not None:
+            self.add(counts)
+
+    def _keys(self, counts):
+        rows = np.atleast_2d(np.asarray(counts, dtype=np.int64))
+        if rows.size and (rows.min() < 0 or rows.max() >= 1 << _WIDE_BITS):
+            bad = np.argwhere((rows < 0) | (rows >= 1 << _WIDE_BITS))[0]
+            raise ValueError(f"{elements[bad[1]]} count {rows[tuple(bad)]} does not fit a CompositionIndex, "
+                             f"which holds 0..{(1 << _WIDE_BITS) - 1} atoms per element")
+        if not self._wide and rows.size and rows.max() >= 1 << _COUNT_BITS:
+            rows_before = [self._rows(block) for block in self._blocks]
+            self._wide = True
+            self._blocks = [np.sort(self._pack(block)) for block in rows_before]
+        return self._pack(rows)
+
+    def _pack(self, rows):
+        if not self._wide:
+            return (rows << _COUNT_SHIFTS).sum(axis=1)
+        half = len(elements) // 2
+        return (rows[:, :half] << _WIDE_SHIFTS).sum(axis=1) + 1j * (rows[:, half:] << _WIDE_SHIFTS).sum(axis=1)
+
+    def _rows(self, keys):
+        if not self._wide:
+            return (keys[:, None] >> _COUNT_SHIFTS) & ((1 << _COUNT_BITS) - 1)
+        words = [keys.real.astype(np.int64), keys.imag.astype(np.int64)]
+        return np.hstack([(w[:, None] >> _WIDE_SHIFTS) & ((1 << _WIDE_BITS) - 1) for w in words])
+
+    def _seen(self, keys):
+        seen = np.zeros(len(keys), dtype=bool)
+        for block in self._blocks:
+            pos = np.searchsorted(block, keys).clip(max=len(block) - 1)
+            seen |= block[pos] == keys
+        return seen
+
+    def _insert(self, keys):
+        # keys: sorted, unique and not yet in the index
+        block = keys
+        while self._blocks and len(self._blocks[-1]) <= 2 * len(block):
+            # blocks are disjoint: concatenate and sort in place, no unique pass
+            block = np.concatenate([self._blocks.pop(), block])
+            block.sort()
+        self._blocks.append(block)
+
+    def __len__(self):
+        return sum(len(block) for block in self._blocks)
+
+    def __contains__(self, counts):
+        return bool(self._seen(self._keys(counts)[:1])[0])
+
+    def add(self, counts):
+        keys = np.unique(self._keys(counts))
+        keys = keys[~self._seen(keys)]
+        if len(keys):
+            self._insert(keys)
+
+    def add_strings(self, alloy_strings):
+        self.add(np.stack([alloy_counts(s) for s in alloy_strings]))
+
+    def filter_new(self, counts, limit=None):
+        """Rows of counts not seen before (first occurrence only), at most limit of them; they are added."""
+        keys = self._keys(counts)
+        unique, first = np.unique(keys, return_index=True)
+        fresh = ~self._seen(unique)
+        keep = np.sort(first[fresh])
+        if limit is not None:
+            keep = keep[:limit]
+        if len(keep):
+            self._insert(np.sort(keys[keep]))
+        if len(keep) == len(keys):
+            return counts
+        return counts[keep]
+
+    def save(self, path):
+        keys = np.sort(np.concatenate(self._blocks)) if self._blocks else np.zeros(0, dtype=np.int64)
+        np.save(path, self._rows(keys).astype(np.int16))
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+
+def alloy_counts(alloy_string):
+    counts = np.zeros(len(elements), dtype=np.int64)
+    for part in alloy_string.split():
+        counts[elements.index(''.join(filter(str.isalpha, part)))] += int(''.join(filter(str.isdigit, part)))
+    return counts
+
+
+def alloy_string(counts):
+    return ' '.join(f'{element}{count}' for element, count in zip(elements, counts) if count > 0)
+
+
+def enumerate_alloys(lat_type, min_elements=5, max_elements=6, mode='exhaustive', num=None,
+                     chunk_size=65536, index=None, seed=None):
+    """Stream valid compositions as [chunk, 10] integer count arrays (`elements` order).
+
+    Every composition has min_elements..max_elements elements, each between
+    5 % and 35 % of the lattice's atoms, as in generate_alloy. Compositions
+    are numbered 0..space-1 and decoded from that rank: mode='exhaustive'
+    walks all ranks in order, mode='sobol' draws ranks from a scrambled Sobol
+    sequence until `num` new compositions were produced (or the space is
+    used up). Rows already in `index` (a CompositionIndex) are dropped and
+    the new ones are added to it, so repeated calls never return duplicates.
+    """
+    if lat_type == 'fcc':
+        total_atoms = 108
+    elif lat_type == 'bcc':
+        total_atoms = 128
+    else:
+        raise ValueError("Invalid structure type! Choose 'fcc' or 'bcc'.")
+    if mode not in ('exhaustive', 'sobol'):
+        raise ValueError(f"mode must be 'exhaustive' or 'sobol', not {mode!r}")
+
+    min_atoms = int(total_atoms * 0.05)
+    max_atoms = int(total_atoms * 0.35)
+    counts = _composition_counts(max_elements, total_atoms, min_atoms, max_atoms)
+
+    blocks = []
+    for k in range(min_elements, max_elements + 1):
+        subsets = np.array(list(itertools.combinations(range(len(elements)), k)))
+        per_subset = int(counts[k, total_atoms])
+        if per_subset:
+            blocks.append((k, subsets, per_subset))
+    sizes = np.array([len(subsets) * per_subset for _, subsets, per_subset in blocks], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    space = int(offsets[-1])
+
+    # cumulative[parts, t, i]: compositions of t into parts + 1 parts whose first part is <= values[i];
+    # flattened with per-(parts, t) offsets so one searchsorted picks every row's next part
+    values = np.arange(min_atoms, max_atoms + 1)
+    rest = np.arange(total_atoms + 1)[:, None] - values[None, :]
+    ways = np.where(rest >= 0, counts[:, np.clip(rest, 0, None)], 0)
+    cumulative = np.cumsum(ways, axis=2)
+    stride = int(cumulative.max()) + 1
+    flat = (cumulative + stride * np.arange(cumulative.shape[0] * cumulative.shape[1]).reshape(
+        cumulative.shape[:2] + (1,))).ravel()
+
+    def decode(ranks):
+        out = np.zeros((len(ranks), len(elements)), dtype=np.int64)
+        block_of = np.searchsorted(offsets, ranks, side='right') - 1
+        for b, (k, subsets, per_subset) in enumerate(blocks):
+            rows = np.nonzero(block_of == b)[0]
+            r = ranks[rows] - offsets[b]
+            subset, rank = subsets[r // per_subset], r % per_subset
+            remaining = np.full(len(rows), total_atoms)
+            for p in range(k):
+                if p == k - 1:
+                    v = remaining
+                else:
+                    table = (k - p - 1) * cumulative.shape[1] + remaining
+                    pos = np.searchsorted(flat, table * stride + rank, side='right')
+                    pick = pos - table * len(values)
+                    rank = rank - np.where(pick > 0, flat[pos - 1] - table * stride, 0)
+                    v = values[pick]
+                out[rows, subset[:, p]] = v
+                remaining = remaining - v
+        return out
+
+    if mode == 'exhaustive':
+        # ranks are unique, so rows are only recorded in an index the caller passed
+        for start in range(0, space, chunk_size):
+            new = decode(np.arange(start, min(start + chunk_size, space)))
+            if index is not None:
+                new = index.filter_new(new)
+            if len(new):
+                yield new
+        return
+
+    index = CompositionIndex() if index is None else index
+    sampler = qmc.Sobol(d=1, scramble=True, seed=seed)
+    produced, drawn = 0, 0
+    while (num is None or produced < num) and drawn < 64 * space:
+        ranks = np.minimum((sampler.random(chunk_size)[:, 0] * space).astype(np.int64), space - 1)
+        drawn += chunk_size
+        new = index.filter_new(decode(ranks), None if num is None else num - produced)
+        produced += len(new)
+        if len(new):
+            yield new
+        if produced >= space:
+            return
+
+
 def parse_input(input_str):
     elements = []
     parts = input_str.split()
@@ -65,14 +279,8 @@ def parse_input(input_str):
         
     return elements
 
-def get_average_lattice_constant(elements):
-    structure_type = None
-    if len(elements) == 128:
-        structure_type = 'bcc'
-    elif len(elements) == 108:
-        structure_type = 'fcc'
-    else:
-        raise ValueError('The input elements number is not satisfied')
+def get_average_lattice_constant(elements, lattice=None):
+    structure_type = lattice or get_structure_type(len(elements))
 
     if structure_type == "fcc":
         constants = fcc_lattice_constants
@@ -81,46 +289,52 @@ def get_average_lattice_constant(elements):
     else:
         raise ValueError("Invalid structure type! Choose 'fcc' or 'bcc'.")
 
-    valid_constants = [
-        constants[el] for el in elements if constants[el] != "u"
-    ]
+    symbols, counts = np.unique(np.asarray(elements), return_counts=True)
+    valid = np.array([constants[el] != "u" for el in symbols])
+    if not valid.any():
+        return default_lattice_constants[structure_type]
 
-    if not valid_constants:
-        if structure_type == "fcc":
-            valid_constants = [3.74383]
-        elif structure_type == "bcc":
-            valid_constants = [2.98683]
-        else:
-            raise ValueError("Problem when get lat constant.")
-    
-    return sum(valid_constants) / len(valid_constants)
+    values = np.array([constants[el] for el in symbols[valid]], dtype=float)
+    return float(np.dot(counts[valid], values) / counts[valid].sum())
 
-def generate_random_structure(elements):
-    structure_type = None
+def generate_random_structure(elements, lattice=None, repeats=None):
+    """Random decoration of an FCC/BCC supercell with the given atoms.
 
-    if len(elements) == 128:
-        structure_type = 'bcc'
-    elif len(elements) == 108:
-        structure_type = 'fcc'
-    else:
-        raise ValueError('The input elements number is not satisfied')
+    The 108/128-atom generator cells by default; lattice and repeats (n or
+    (n, m, l) conventional cells) give any other supercell, with as many
+    elements as it has sites.
+    """
+    structure_type, repeats = resolve_supercell(len(elements), lattice, repeats)
 
-    lattice_constant = get_average_lattice_constant(elements)
+    lattice_constant = get_average_lattice_constant(elements, structure_type)
     random.shuffle(elements)  
 
-    num_atoms = len(elements)
-    
-    base_bulk = bulk('X', crystalstructure=structure_type, a=lattice_constant, cubic=True)
-    if structure_type == 'bcc':
-        hea = make_supercell(base_bulk, [[4, 0, 0], [0, 4, 0], [0, 0, 4]])
-    elif structure_type == 'fcc':
-        hea = make_supercell(base_bulk, [[3, 0, 0], [0, 3, 0], [0, 0, 3]])
-    else:
-        raise ValueError(f"wrong structure_type.")
-    hea.set_chemical_symbols(elements[:num_atoms])  
+    n, scaled_positions = supercell_template(structure_type, repeats)
+    hea = Atoms(elements, scaled_positions=scaled_positions,
+                cell=np.eye(3) * lattice_constant * n, pbc=True)
 
     return hea
 
+def generate_random_decorations(elements, num, seed=None, lattice=None, repeats=None):
+    """num random site decorations of one composition, as stacked arrays.
+
+    Returns (cell [3, 3], scaled_positions [N, 3], species [num, N]) where
+    species holds indices into `elements` order; decoration_to_atoms turns
+    one row back into an Atoms object. lattice and repeats as in
+    generate_random_structure.
+    """
+    structure_type, repeats = resolve_supercell(len(elements), lattice, repeats)
+    lattice_constant = get_average_lattice_constant(elements, structure_type)
+    n, scaled_positions = supercell_template(structure_type, repeats)
+
+    species = np.array([ELEMENT_INDEX[el] for el in elements], dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    decorations = rng.permuted(np.tile(species, (num, 1)), axis=1)
+    return np.eye(3) * lattice_constant * n, scaled_positions, decorations
+
+def decoration_to_atoms(cell, scaled_positions, species):
+    return Atoms([elements[i] for i in species], scaled_positions=scaled_positions, cell=cell, pbc=True)
+
 def save_cif(structure, filename="hea.cif"):
     write(filename, structure)
     print(f"Structure saved as {filename}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+from functools import lru_cache
+import numpy as np
+
+
+# FCC/BCC supercell geometry shared by mkhea (generation) and hea2graph
+# (featurization); numpy only, so the inference path stays light
+
+supercell_repeats = {'fcc': 3, 'bcc': 4}
+
+atoms_per_cell = {'fcc': 4, 'bcc': 2}
+
+default_lattice_constants = {'fcc': 3.74383, 'bcc': 2.98683}
+
+# fractional coordinates of the conventional cell, in ase.build.bulk(cubic=True) order
+cell_basis = {
+    'fcc': np.array([[0, 0, 0], [0, 0.5, 0.5], [0.5, 0, 0.5], [0.5, 0.5, 0]]),
+    'bcc': np.array([[0, 0, 0], [0.5, 0.5, 0.5]]),
+}
+
+
+def get_structure_type(num_atoms):
+    if num_atoms == 128:
+        return 'bcc'
+    elif num_atoms == 108:
+        return 'fcc'
+    else:
+        raise ValueError('The input elements number is not satisfied; pass lattice= for supercells '
+                         'other than 108 (FCC) / 128 (BCC) atoms')
+
+
+def _repeats(structure_type, repeats):
+    # None -> the generator's cubic size, n -> (n, n, n), (n, m, l) as is
+    if repeats is None:
+        repeats = supercell_repeats[structure_type]
+    return tuple(int(r) for r in np.broadcast_to(repeats, 3))
+
+
+def supercell_size(structure_type, repeats=None):
+    """Number of atoms of the n x m x l conventional-cell supercell."""
+    return atoms_per_cell[structure_type] * int(np.prod(_repeats(structure_type, repeats)))
+
+
+def resolve_supercell(num_atoms, lattice=None, repeats=None):
+    """(lattice, (n, m, l)) for num_atoms sites.
+
+    Without lattice the generator's 108 (FCC) / 128 (BCC) sizes are
+    assumed; without repeats the supercell is cubic.
+    """
+    if lattice is None:
+        lattice = get_structure_type(num_atoms)
+    if lattice not in atoms_per_cell:
+        raise ValueError("Invalid structure type! Choose 'fcc' or 'bcc'.")
+    if repeats is None:
+        repeats = round((num_atoms / atoms_per_cell[lattice]) ** (1 / 3))
+    repeats = _repeats(lattice, repeats)
+    if supercell_size(lattice, repeats) != num_atoms:
+        raise ValueError(f"{num_atoms} atoms do not fill a {'x'.join(map(str, repeats))} {lattice} supercell")
+    return lattice, repeats
+
+
+@lru_cache(maxsize=None)
+def supercell_template(structure_type, n=None):
+    """Repeat counts and fractional coordinates (ase make_supercell order) of the
+    supercell for structure_type: n x n x n conventional cells for an int n,
+    n x m x l for a tuple, the generator's size by default. Only the lattice
+    constant varies between structures."""
+    if structure_type not in cell_basis:
+        raise ValueError("Invalid structure type! Choose 'fcc' or 'bcc'.")
+    n = _repeats(structure_type, n)
+    # cell by cell, the last axis fastest, the basis atoms within each cell
+    cells = np.array(np.meshgrid(*[np.arange(r) for r in n], indexing='ij')).reshape(3, -1).T
+    scaled_positions = ((cells[:, None, :] + cell_basis[structure_type]) / n).reshape(-1, 3)
+    scaled_positions.flags.writeable = False
+    return np.array(n), scaled_positions
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import math
+import numpy as np
+import torch
+from ase import Atoms
+from hea2graph import ELEMENT_DATA, atoms_to_arrays, species_indices, node_features, edge_attributes
+from delta import K_B
+
+
+class SwapEvaluator:
+    """GTCN energy of one supercell under species swaps, recomputing each layer
+    only on the receptive field of the two swapped sites."""
+
+    def __init__(self, model, atoms, cutoff=3.5, lattice=None):
+        self.model = model.eval()
+        self.cell = atoms.get_cell()
+        self.positions = atoms.get_positions()
+        self.pbc = atoms.get_pbc()
+        self.species = species_indices(atoms.get_chemical_symbols())
+        self.num_atoms = len(atoms)
+        self.lattice = lattice
+
+        graph = atoms_to_arrays(atoms, cutoff, lattice=lattice)
+        self.degree = graph['node_features'][:, -1]
+        self.src, self.dst = graph['edge_index']
+        # edges are sorted by target: the incoming edges of node v are ptr[v]:ptr[v+1]
+        self.ptr = np.searchsorted(self.dst, np.arange(self.num_atoms + 1))
+        self.edge_index = torch.as_tensor(graph['edge_index'], dtype=torch.long)
+
+        self.convs = model.conv_stack()
+        self._pending = None
+        with torch.no_grad():
+            x = torch.as_tensor(graph['node_features'], dtype=torch.float)
+            self.edge_attr = torch.as_tensor(graph['edge_attr'], dtype=torch.float) / model.edge_scale
+            self.states = [model.embed_nodes(x)]
+            for conv, residual in self.convs:
+                h = self.states[-1]
+                out = conv(h, self.edge_index, self.edge_attr)
+                self.states.append(model.conv_step(h, out, residual))
+            self.node_out = self._readout(self.states[-1]) if model.readout == 'node' else None
+            self.energy = self._energy(self.states[-1], self.node_out)
+
+    def _readout(self, h):
+        out = self.model.readout_head(h, None)
+        return torch.clip(out, self.model.YMIN, self.model.YMAX)
+
+    def _energy(self, h, node_out):
+        if self.model.readout == 'node':
+            return float(node_out.mean())
+        return float(self._readout(h))
+
+    def _in_edges(self, nodes):
+        starts, stops = self.ptr[nodes], self.ptr[nodes + 1]
+        counts = stops - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    @staticmethod
+    def _patched(base, index, changed_index, changed_values):
+        # base[index] with the rows listed in sorted changed_index replaced
+        out = base[torch.as_tensor(index)]
+        if len(changed_index):
+            pos = np.searchsorted(changed_index, index).clip(max=len(changed_index) - 1)
+            hit = changed_index[pos] == index
+            if hit.any():
+                out[torch.as_tensor(np.flatnonzero(hit))] = changed_values[torch.as_tensor(pos[hit])]
+        return out
+
+    @torch.no_grad()
+    def propose(self, i, j):
+        """Energy after swapping the species of sites i and j (not committed)."""
+        species = self.species.copy()
+        species[[i, j]] = species[[j, i]]
+        sites = np.unique([i, j])
+        if species[i] == species[j]:
+            self._pending = (species, [], np.zeros(0, dtype=np.int64), None, None)
+            return self.energy
+
+        x = node_features(species[sites], self.degree[sites])
+        changed = sites
+        values = self.model.embed_nodes(torch.as_tensor(x, dtype=torch.float))
+        updates = [(changed, values)]
+
+        # edges touching i or j get new electronegativity_diff / mismatch
+        edges = np.concatenate([self._in_edges(sites), np.flatnonzero(np.isin(self.src, sites))])
+        edges = np.unique(edges)
+        en_diff, mismatch = edge_attributes(species, self.src[edges], self.dst[edges], self.num_atoms,
+                                            self.lattice)
+        edge_values = self.edge_attr[torch.as_tensor(edges)].clone()
+        edge_values[:, 1] = torch.as_tensor(en_diff, dtype=torch.float) / self.model.edge_scale[1]
+        edge_values[:, 2] = torch.as_tensor(mismatch, dtype=torch.float) / self.model.edge_scale[2]
+
+        for level, (conv, residual) in enumerate(self.convs):
+            # targets: the changed nodes and their neighbours; sources: all their in-neighbours
+            targets = np.union1d(changed, self.src[self._in_edges(changed)])
+            eids = self._in_edges(targets)
+            sources, local_src = np.unique(self.src[eids], return_inverse=True)
+            local_dst = np.repeat(np.arange(len(targets)), self.ptr[targets + 1] - self.ptr[targets])
+            sub_index = torch.as_tensor(np.stack([local_src.reshape(-1), local_dst]), dtype=torch.long)
+            sub_attr = self._patched(self.edge_attr, eids, edges, edge_values)
+
+            h = self.states[level]
+            h_src = self._patched(h, sources, changed, values)
+            h_dst = self._patched(h, targets, changed, values)
+            out = conv((h_src, h_dst), sub_index, sub_attr)
+            values = self.model.conv_step(h_dst, out, residual)
+            changed = targets
+            updates.append((changed, values))
+
+        node_out = None
+        if self.model.readout == 'node':
+            node_out = self.node_out.clone()
+            node_out[torch.as_tensor(changed)] = self._readout(values)
+            h_last = None
+        else:
+            h_last = self.states[-1].index_copy(0, torch.as_tensor(changed), values)
+        energy = self._energy(h_last, node_out)
+        self._pending = (species, updates, edges, edge_values, (node_out, energy))
+        return energy
+
+    def accept(self):
+        """Commit the last proposed swap."""
+        species, updates, edges, edge_values, result = self._pending
+        self._pending = None
+        self.species = species
+        if result is None:
+            return
+        for level, (index, values) in enumerate(updates):
+            self.states[level][torch.as_tensor(index)] = values
+        self.edge_attr[torch.as_tensor(edges)] = edge_values
+        self.node_out, self.energy = result
+
+    def atoms(self):
+        """The current decoration as ASE Atoms."""
+        symbols = [ELEMENT_DATA['Element'][s] for s in self.species]
+        return Atoms(symbols, positions=self.positions, cell=self.cell, pbc=self.pbc)
+
+
+def run_swap_mc(model, atoms, steps, temperature, cutoff=3.5, seed=None, lattice=None):
+    """Metropolis Monte Carlo over species swaps of one supercell at `temperature` K.
+
+    Each step swaps two random sites of different species and accepts with
+    probability min(1, exp(-dE / kT)), dE being the change of the total
+    energy (predicted per-atom energy times the number of atoms). Returns
+    the final Atoms, the per-step energies and the acceptance rate.
+    """
+    rng = np.random.default_rng(seed)
+    evaluator = SwapEvaluator(model, atoms, cutoff, lattice)
+    if len(np.unique(evaluator.species)) < 2:
+        raise ValueError("run_swap_mc needs at least two species to swap")
+    kT = K_B * temperature
+    energies, accepted = [evaluator.energy], 0
+    for _ in range(steps):
+        i, j = rng.choice(evaluator.num_atoms, 2, replace=False)
+        while evaluator.species[i] == evaluator.species[j]:
+            i, j = rng.choice(evaluator.num_atoms, 2, replace=False)
+        energy = evaluator.propose(i, j)
+        d_energy = (energy - evaluator.energy) * evaluator.num_atoms
+        if d_energy <= 0 or (kT > 0 and rng.random() < math.exp(-d_energy / kT)):
+            evaluator.accept()
+            accepted += 1
+        energies.append(evaluator.energy)
+    return evaluator.atoms(), np.array(energies), accepted / max(steps, 1)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#author: xhwan
+
+import os
+import os.path as osp
+import argparse
+import multiprocessing
+from time import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+
+def run_fold(config_dict, data_path, Total_num, splitpara, fold, seeds, threads, root_dir):
+    """Train one fold for every seed inside a single worker process.
+
+    The cached HEADataset is opened memory-mapped once and reused for all
+    seeds, so the featurized tensors are shared with the other folds'
+    workers through the page cache and nothing is re-featurized.
+    """
+    import torch
+    from utils import utils
+    from headata import HEADataset
+    from train import train
+
+    torch.set_num_threads(threads)
+    config = utils.dict2namedtuple(config_dict)
+    dataset = HEADataset(data_path, cutoff=getattr(config, 'cutoff', 3.5),
+                         per_atom=getattr(config, 'per_atom', False), mmap=True)
+
+    rows = []
+    for seed in seeds:
+        start = time()
+        msgs = train(config, data_path, Total_num, splitpara, fold=fold, seed=seed, logger=False,
+                     accelerator='cpu', dataset=dataset, progress_bar=False,
+                     default_root_dir=osp.join(root_dir, f"fold{fold}_seed{seed}"))
+        rows.append({"fold": fold, "seed": seed, "valid_mae": msgs['VALID MAE'], "seconds": time() - start})
+    return rows
+
+
+def summarize(results):
+    """fold x seed table of valid MAE plus per-fold and overall mean/std."""
+    table = results.pivot(index="fold", columns="seed", values="valid_mae")
+    table.columns = [f"seed_{s}" for s in table.columns]
+    table["mean"] = table.mean(axis=1)
+    table["std"] = results.groupby("fold")["valid_mae"].std(ddof=0)
+    overall = pd.DataFrame({"mean": [results["valid_mae"].mean()], "std": [results["valid_mae"].std(ddof=0)]},
+                           index=pd.Index(["all"], name="fold"))
+    return pd.concat([table, overall])
+
+
+def sweep(config, data_path, Total_num, splitpara, folds=5, seeds=(124, 125, 126), workers=None,
+          root_dir="sweep", summary_file="sweep_summary.csv"):
+    """K-fold x seed sweep of GTCN on CPU, one worker process per fold.
+
+    The HEADataset cache is built (or validated) once here before any
+    worker starts. Cores are split evenly between the workers. Per-run
+    results go to root_dir/sweep_results.csv and the summarize() table to
+    root_dir/summary_file; the table is returned.
+    """
+    from headata import HEADataset
+
+    HEADataset(data_path, cutoff=getattr(config, 'cutoff', 3.5), per_atom=getattr(config, 'per_atom', False))
+    folds = list(range(folds)) if isinstance(folds, int) else list(folds)
+    workers = min(workers or len(folds), len(folds))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(root_dir, exist_ok=True)
+
+    rows = []
+    start = time()
+    # spawn: torch/OpenMP state does not survive fork reliably
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(run_fold, config._asdict(), data_path, Total_num, splitpara, fold, list(seeds),
+                               threads, root_dir): fold for fold in folds}
+        for future in as_completed(futures):
+            rows.extend(future.result())
+            print(f"fold {futures[future]} done after {time() - start:.1f} s")
+
+    results = pd.DataFrame(rows).sort_values(["fold", "seed"])
+    results.to_csv(osp.join(root_dir, "sweep_results.csv"), index=False)
+    table = summarize(results)
+    table.to_csv(osp.join(root_dir, summary_file))
+    print(table.to_string(float_format=lambda v: f"{v:.4f}"))
+    return table
+
+
+if __name__ == "__main__":
+    from utils import utils
+
+    parser = argparse.ArgumentParser(description='K-fold x seed GTCN sweep on CPU')
+    parser.add_argument('--data', '-d', dest='data', default='data')
+    parser.add_argument('--config', '-c', dest='config', default='test.yaml')
+    parser.add_argument('--folds', '-k', dest='folds', default=5, type=int)
+    parser.add_argument('--seeds', '-s', dest='seeds', default=[124, 125, 126], type=int, nargs='+')
+    parser.add_argument('--workers', '-w', dest='workers', default=None, type=int)
+    parser.add_argument('--total', dest='total', default=900, type=int)
+    parser.add_argument('--split', dest='split', default=[720, 180], type=int, nargs=2)
+    parser.add_argument('--out', '-o', dest='out', default='sweep')
+    args = parser.parse_args()
+
+    config = utils.load_yaml(args.config)
+    sweep(config, args.data, args.total, args.split, args.folds, args.seeds, args.workers, args.out)
@@ -2,10 +2,9 @@ import argparse
 import os
 import os.path as osp
 import pytorch_lightning as pl
-import lightning_lite
 import torch.nn.functional as F
 from utils import utils
-from data.data import get_dl, gety
+from headata import get_dl, gety
 from models.GTCN import GTCN
 from pytorch_lightning.loggers import WandbLogger
 from pytorch_lightning.callbacks import TQDMProgressBar
@@ -13,42 +12,33 @@ import torch
 import wandb
 
 
-os.environ['CUDA_VISIBLE_DEVICES'] = '0'
 
-parser = argparse.ArgumentParser(description='Traing GTCN')
-parser.add_argument('--gpu', '-g', dest='gpu', default=0)
-parser.add_argument('--seed', '-s', dest='seed', default=124, type=int)
-parser.add_argument('--fold', '-f', dest='fold', default=0, type=int)
-args = parser.parse_args()
-
-lightning_lite.utilities.seed.seed_everything(seed=args.seed, workers=True)
-
-yaml_path = osp.join(os.getcwd(), 'test.yaml')
-config = utils.load_yaml(yaml_path)
-
-model = GTCN(config)
-
-
-
-def train(config, data_path, Total_num, splitpara, logger=True):
+def train(config, data_path, Total_num, splitpara, fold=0, seed=124, logger=True,
+          accelerator='gpu', devices=1, dataset=None, progress_bar=True, default_root_dir=None):
 
     print(config)
+    pl.seed_everything(seed=seed, workers=True)
+    model = GTCN(config)
 
-    train_dl, valid_dl = get_dl(config, data_path, Total_num, splitpara)
+    train_dl, valid_dl = get_dl(config, data_path, Total_num, splitpara, fold, dataset)
     print(f'train: {len(train_dl)} valid: {len(valid_dl)}')
 
     print('Start training:')
     EPOCHS = config.epochs
     checkpoint_callback = pl.callbacks.ModelCheckpoint(monitor='valid_mae', mode='min')
-    pcb = TQDMProgressBar(refresh_rate=1)
-    trainer = pl.Trainer(accelerator='gpu', devices=1,
-                     strategy=None,
-                     max_epochs=EPOCHS, 
-                     callbacks=[checkpoint_callback, pcb],
+    callbacks = [checkpoint_callback]
+    if progress_bar:
+        callbacks.append(TQDMProgressBar(refresh_rate=1))
+    trainer = pl.Trainer(accelerator=accelerator, devices=devices,
+                     max_epochs=EPOCHS,
+                     callbacks=callbacks,
+                     enable_progress_bar=progress_bar,
                      logger=logger,
-                     precision=16,
+                     # fp16 autocast only pays off on GPU
+                     precision=16 if accelerator == 'gpu' else 32,
                      gradient_clip_val=config.gradient_clip_val,
-                     gradient_clip_algorithm="value"
+                     gradient_clip_algorithm="value",
+                     default_root_dir=default_root_dir
                     )
 
     trainer.fit(model, train_dataloaders=train_dl, val_dataloaders=valid_dl)
@@ -56,7 +46,7 @@ def train(config, data_path, Total_num, splitpara, logger=True):
     print('Predict valid:')
     y_p = trainer.predict(model, valid_dl)
     y_p = torch.cat(y_p, dim=0)
-    y = gety(valid_dl)
+    y = gety(valid_dl, getattr(config, 'readout', 'node'))
 
     score1 = F.l1_loss(y_p, y).item()
 
@@ -67,8 +57,22 @@ def train(config, data_path, Total_num, splitpara, logger=True):
 
 
 if __name__ == "__main__":
-    quick_run = False                                   
-    
-    dataset_path = r'F:\data'
-    train(config=config, data_path=dataset_path, Total_num=900, splitpara=[720, 180])
+    parser = argparse.ArgumentParser(description='Traing GTCN')
+    parser.add_argument('--gpu', '-g', dest='gpu', default=0)
+    parser.add_argument('--seed', '-s', dest='seed', default=124, type=int)
+    parser.add_argument('--fold', '-f', dest='fold', default=0, type=int)
+    parser.add_argument('--accelerator', '-a', dest='accelerator', default='gpu')
+    parser.add_argument('--data', '-d', dest='data', default='data')
+    args = parser.parse_args()
+
+    if args.accelerator == 'gpu':
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(args.gpu)
+
+    yaml_path = osp.join(os.getcwd(), 'test.yaml')
+    config = utils.load_yaml(yaml_path)
+
+    quick_run = False
+
+    train(config=config, data_path=args.data, Total_num=900, splitpara=[720, 180], fold=args.fold,
+          seed=args.seed, accelerator=args.accelerator)
 